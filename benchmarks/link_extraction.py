@@ -0,0 +1,255 @@
+"""Micro-benchmark for link extraction.
+
+Scores the old regex-over-text extraction, the entity-based extractor and its
+text-only fallback against real posts from a Telegram Desktop chat export
+(Export chat history -> JSON). Labels come from Telegram's own link detection
+in that export, so the fallback's validation is measured against a source it
+was not written for. Forward a few hundred channel posts to a chat, export it
+and run from the repository root:
+
+    python -m benchmarks.link_extraction --export result.json
+
+Without --export the built-in SAMPLE is used. It is hand-written around the
+edge cases the extractor handles, including traps the file-extension rule
+does not cover, so it shows behaviour, not how well validation generalises.
+"""
+import argparse
+import json
+import re
+import timeit
+
+from aiogram.types import MessageEntity
+
+from tgbot.services.urls import extract_links
+
+OLD_LINK_PATTERN = r'(https?://[^\s]+|www\.[^\s]+|[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}(?:/[^\s]*)?)'
+
+# (text, entities, expected links). Entities are given as ('url', substring) or
+# ('text_link', anchor, href) and converted to UTF-16 offsets like Telegram sends them.
+SAMPLE = [
+    (
+        'Вышел Python 3.13 🎉 Подробности в релизе, а changelog тут: https://docs.python.org/3.13/whatsnew/3.13.html',
+        [('text_link', 'релизе', 'https://www.python.org/downloads/release/python-3130/'),
+         ('url', 'https://docs.python.org/3.13/whatsnew/3.13.html')],
+        ['https://www.python.org/downloads/release/python-3130/', 'https://docs.python.org/3.13/whatsnew/3.13.html'],
+    ),
+    (
+        'Разбор asyncio за 10 минут. Читать статью\n\n#python #asyncio',
+        [('text_link', 'Читать статью', 'https://habr.com/ru/articles/667630/')],
+        ['https://habr.com/ru/articles/667630/'],
+    ),
+    (
+        'Обновили main.py и settings.py, версия v1.2.3 уже на сервере.',
+        [],
+        [],
+    ),
+    (
+        'Пишите на support@example.com или в чат t.me/notion_chat',
+        [('url', 't.me/notion_chat')],
+        ['t.me/notion_chat'],
+    ),
+    (
+        'Подборка курсов (бесплатно): https://stepik.org/course/67/promo, https://ru.hexlet.io/courses.',
+        [('url', 'https://stepik.org/course/67/promo'), ('url', 'https://ru.hexlet.io/courses')],
+        ['https://stepik.org/course/67/promo', 'https://ru.hexlet.io/courses'],
+    ),
+    (
+        'Источник — РБК. Подписывайтесь на канал!',
+        [('text_link', 'РБК', 'https://www.rbc.ru/technology_and_media/18/10/2024/6711f2a59a79479b7a4c1c1d'),
+         ('text_link', 'Подписывайтесь', 'https://t.me/+AbCdEfGhIjKlMmNn')],
+        ['https://www.rbc.ru/technology_and_media/18/10/2024/6711f2a59a79479b7a4c1c1d', 'https://t.me/+AbCdEfGhIjKlMmNn'],
+    ),
+    (
+        'Скачать архив release.zip, инструкция в README.md',
+        [],
+        [],
+    ),
+    (
+        'Документация: www.sqlalchemy.org/docs (см. раздел про asyncio)',
+        [('url', 'www.sqlalchemy.org/docs')],
+        ['www.sqlalchemy.org/docs'],
+    ),
+    (
+        'Сайт проекта — кодинг.рф, зеркало example.org',
+        [('url', 'кодинг.рф'), ('url', 'example.org')],
+        ['кодинг.рф', 'example.org'],
+    ),
+    (
+        'Статья https://en.wikipedia.org/wiki/Python_(programming_language) очень подробная',
+        [('url', 'https://en.wikipedia.org/wiki/Python_(programming_language)')],
+        ['https://en.wikipedia.org/wiki/Python_(programming_language)'],
+    ),
+    (
+        'Курс валют 1.05, индекс 3.2%, рост 0.7.',
+        [],
+        [],
+    ),
+    (
+        '🔥 Топ-5 VS Code расширений → смотреть\nВидео → YouTube',
+        [('text_link', 'смотреть', 'https://code.visualstudio.com/docs/editor/extension-marketplace'),
+         ('text_link', 'YouTube', 'https://youtu.be/dQw4w9WgXcQ')],
+        ['https://code.visualstudio.com/docs/editor/extension-marketplace', 'https://youtu.be/dQw4w9WgXcQ'],
+    ),
+    (
+        'Запуск: python -m tgbot, конфиг в config.py, логи в bot.log',
+        [],
+        [],
+    ),
+    (
+        'Ссылки из выгрузки без разметки: https://github.com/aiogram/aiogram и github.com/sqlalchemy/sqlalchemy.',
+        [],
+        ['https://github.com/aiogram/aiogram', 'github.com/sqlalchemy/sqlalchemy'],
+    ),
+    (
+        'Подключайтесь к эфиру в 19:00 по ссылке',
+        [('text_link', 'ссылке', 'https://zoom.us/j/1234567890?pwd=abc')],
+        ['https://zoom.us/j/1234567890?pwd=abc'],
+    ),
+    (
+        'Наш бот: @notion_links_bot, канал: @notion_news',
+        [],
+        [],
+    ),
+    (
+        'Новый релиз node 22.1.0 и deno 2.0 — что изменилось? https://deno.com/blog/v2.0',
+        [('url', 'https://deno.com/blog/v2.0')],
+        ['https://deno.com/blog/v2.0'],
+    ),
+    (
+        '«Прочитать полностью» https://vc.ru/future/123456-ai»',
+        [('url', 'https://vc.ru/future/123456-ai')],
+        ['https://vc.ru/future/123456-ai'],
+    ),
+    (
+        'Профиль автора',
+        [('text_link', 'автора', 'tg://user?id=123456789')],
+        [],
+    ),
+    (
+        'Репозиторий: gitlab.com/group/project/-/merge_requests/42; задача в jira.company.io/browse/PRJ-1!',
+        [('url', 'gitlab.com/group/project/-/merge_requests/42'), ('url', 'jira.company.io/browse/PRJ-1')],
+        ['gitlab.com/group/project/-/merge_requests/42', 'jira.company.io/browse/PRJ-1'],
+    ),
+    # file names on real country-code suffixes that FILE_SUFFIXES does not list
+    (
+        'Правки в lib.rs и utils.cc, зависимости в requirements.in, сборка через Makefile.am',
+        [],
+        [],
+    ),
+    (
+        'Модель обучали на ai.google.dev, веса лежат в model.pt, конфиг в train.pl',
+        [],
+        ['ai.google.dev'],
+    ),
+]
+
+EXPORT_ENTITY_TYPES = {'link': 'url', 'text_link': 'text_link'}
+
+
+def _utf16_len(text: str) -> int:
+    return len(text.encode('utf-16-le')) // 2
+
+
+def _entities(text: str, specs) -> list[MessageEntity]:
+    entities = []
+    for spec in specs:
+        start = text.index(spec[1])
+        offset, length = _utf16_len(text[:start]), _utf16_len(spec[1])
+        if spec[0] == 'text_link':
+            entities.append(MessageEntity(type='text_link', offset=offset, length=length, url=spec[2]))
+        else:
+            entities.append(MessageEntity(type='url', offset=offset, length=length))
+    return entities
+
+
+def load_export(path: str) -> list:
+    with open(path, encoding='utf-8') as file:
+        messages = json.load(file).get('messages', [])
+
+    corpus = []
+    for message in messages:
+        parts = message.get('text_entities') or []
+        text = ''.join(part['text'] for part in parts)
+        if not text:
+            continue
+        entities, expected = [], []
+        offset = 0
+        for part in parts:
+            length = _utf16_len(part['text'])
+            if part['type'] != 'plain':
+                entity_type = EXPORT_ENTITY_TYPES.get(part['type'], part['type'])
+                url = part.get('href') if entity_type == 'text_link' else None
+                entities.append(MessageEntity(type=entity_type, offset=offset, length=length, url=url))
+                if entity_type == 'url':
+                    expected.append(part['text'])
+                elif url and url.lower().startswith(('http://', 'https://')):
+                    expected.append(url)
+            offset += length
+        corpus.append((text, entities, expected))
+    return corpus
+
+
+def old_extract(text, entities):
+    return list(dict.fromkeys(re.findall(OLD_LINK_PATTERN, text)))
+
+
+def new_extract(text, entities):
+    return extract_links(text, entities)
+
+
+def new_extract_text_only(text, entities):
+    return extract_links(text, None)
+
+
+def score(extractor, corpus) -> tuple[float, float]:
+    true_positive = false_positive = false_negative = 0
+    for text, entities, expected in corpus:
+        found = set(extractor(text, entities))
+        expected = set(expected)
+        true_positive += len(found & expected)
+        false_positive += len(found - expected)
+        false_negative += len(expected - found)
+    precision = true_positive / (true_positive + false_positive) if true_positive + false_positive else 1.0
+    recall = true_positive / (true_positive + false_negative) if true_positive + false_negative else 1.0
+    return precision, recall
+
+
+def per_message_cost(extractor, corpus, number: int) -> float:
+    def run():
+        for text, entities, _ in corpus:
+            extractor(text, entities)
+    return timeit.timeit(run, number=number) / (number * len(corpus)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--export', help='result.json from a Telegram Desktop chat export')
+    parser.add_argument('--number', type=int, default=2000, help='passes over the corpus for timing')
+    args = parser.parse_args()
+
+    if args.export:
+        corpus = load_export(args.export)
+    else:
+        corpus = [(text, _entities(text, specs), expected) for text, specs, expected in SAMPLE]
+    with_entities = [item for item in corpus if item[1]]
+    without_entities = [item for item in corpus if not item[1]]
+    extractors = [
+        ('old regex', old_extract),
+        ('entities', new_extract),
+        ('fallback only', new_extract_text_only),
+    ]
+    for name, extractor in extractors:
+        extractor(*corpus[0][:2])  # warm up lazy tldextract state
+    print(f'{len(corpus)} messages ({len(with_entities)} with entities), '
+          f'{sum(len(expected) for _, _, expected in corpus)} labelled links')
+    print(f'{"extractor":<15}{"precision":>10}{"recall":>10}{"us/msg":>10}{"with entities":>15}{"without":>10}')
+    for name, extractor in extractors:
+        precision, recall = score(extractor, corpus)
+        cost = per_message_cost(extractor, corpus, args.number)
+        entity_cost = per_message_cost(extractor, with_entities, args.number) if with_entities else float('nan')
+        plain_cost = per_message_cost(extractor, without_entities, args.number) if without_entities else float('nan')
+        print(f'{name:<15}{precision:>10.2f}{recall:>10.2f}{cost:>10.1f}{entity_cost:>15.1f}{plain_cost:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
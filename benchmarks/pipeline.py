@@ -0,0 +1,408 @@
+"""Offline load test for the handler pipeline.
+
+Feeds synthetic updates through the real Dispatcher (handlers.setup() plus the
+production middlewares) with a mocked Bot API session, a local HTTP server
+serving the linked pages and a fake Notion API. Reports per-handler latency
+percentiles, updates per second, DB queries per update and peak memory as JSON.
+
+Run from the repository root:
+
+    python -m benchmarks.pipeline --users 50 --rounds 3 --output before.json
+    python -m benchmarks.pipeline --users 50 --rounds 3 --baseline before.json
+
+The bot always runs against --database-url (a throwaway SQLite file by
+default), never against the DATABASE_URL from the environment. Linked pages
+are spread over 127.0.0.1..N; on systems without the whole 127/8 loopback
+range (macOS) pass --page-hosts 1.
+"""
+import argparse
+import asyncio
+import contextvars
+import datetime
+import itertools
+import json
+import logging
+import os
+import platform
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+
+from aiohttp import web
+
+HANDLERS = ('handle_message_with_links', 'handle_link_selection', 'handle_category_selection', 'handle_new_category',
+            'handle_priority_selection', 'handle_get_links', 'handle_get_category')
+
+current_queries = contextvars.ContextVar('current_queries', default=None)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _percentile(quantiles: list[float], p: int) -> float:
+    return round(quantiles[p - 1] * 1000, 3)
+
+
+def _summary(samples: list[float]) -> dict:
+    if len(samples) < 2:
+        value = round(samples[0] * 1000, 3) if samples else None
+        return {'count': len(samples), 'mean_ms': value, 'p50_ms': value, 'p95_ms': value, 'p99_ms': value}
+    quantiles = statistics.quantiles(samples, n=100, method='inclusive')
+    return {
+        'count': len(samples),
+        'mean_ms': round(statistics.fmean(samples) * 1000, 3),
+        'p50_ms': _percentile(quantiles, 50),
+        'p95_ms': _percentile(quantiles, 95),
+        'p99_ms': _percentile(quantiles, 99),
+    }
+
+
+async def start_pages_server(hosts: list[str], port: int, delay: float) -> web.AppRunner:
+    async def page(request: web.Request) -> web.Response:
+        if delay:
+            await asyncio.sleep(delay)
+        number = request.match_info['number']
+        body = (
+            f'<html><head><title>Page {number}</title>'
+            f'<meta property="og:title" content="Benchmark page {number}">'
+            f'<meta property="og:type" content="article"></head>'
+            f'<body>{"<p>lorem ipsum</p>" * 200}</body></html>'
+        )
+        return web.Response(text=body, content_type='text/html')
+
+    app = web.Application()
+    app.router.add_get('/page/{number}', page)
+    return await _start(app, port, hosts)
+
+
+async def start_notion_server(port: int, delay: float, stats: dict) -> web.AppRunner:
+    async def create_page(request: web.Request) -> web.Response:
+        await request.read()
+        if delay:
+            await asyncio.sleep(delay)
+        stats['pages'] += 1
+        return web.json_response({'object': 'page', 'id': str(uuid.uuid4())})
+
+    async def update_page(request: web.Request) -> web.Response:
+        await request.read()
+        return web.json_response({'object': 'page', 'id': request.match_info['page_id'], 'archived': True})
+
+    async def query_database(request: web.Request) -> web.Response:
+        await request.read()
+        return web.json_response({'object': 'list', 'results': [], 'has_more': False, 'next_cursor': None})
+
+    async def me(request: web.Request) -> web.Response:
+        return web.json_response({'object': 'user', 'id': str(uuid.uuid4()), 'type': 'bot'})
+
+    app = web.Application()
+    app.router.add_post('/v1/pages', create_page)
+    app.router.add_patch('/v1/pages/{page_id}', update_page)
+    app.router.add_post('/v1/databases/{database_id}/query', query_database)
+    app.router.add_get('/v1/users/me', me)
+    return await _start(app, port, ['127.0.0.1'])
+
+
+async def _start(app: web.Application, port: int, hosts: list[str]) -> web.AppRunner:
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    for host in hosts:
+        await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+def build_session_class():
+    from aiogram.client.session.base import BaseSession
+    from aiogram.methods import SendMessage, EditMessageText, SendDocument
+    from aiogram.types import Message, Chat
+
+    class FakeSession(BaseSession):
+        """Answers Bot API calls locally and counts them."""
+
+        def __init__(self):
+            super().__init__()
+            self.calls = defaultdict(int)
+            self._message_ids = itertools.count(1)
+
+        async def make_request(self, bot, method, timeout=None):
+            self.calls[type(method).__name__] += 1
+            if isinstance(method, (SendMessage, EditMessageText, SendDocument)):
+                return Message(
+                    message_id=getattr(method, 'message_id', None) or next(self._message_ids),
+                    date=datetime.datetime.now(),
+                    chat=Chat(id=method.chat_id, type='private'),
+                    text=getattr(method, 'text', None),
+                )
+            return True
+
+        async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+            yield b''
+
+        async def close(self):
+            pass
+
+    return FakeSession
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.queries = defaultdict(int)
+        self.update_queries = 0
+        self.updates = 0
+        self.background_queries = 0
+
+    def on_execute(self, *args):
+        counter = current_queries.get()
+        if counter is None:
+            self.background_queries += 1
+        else:
+            counter[0] += 1
+
+    async def update_middleware(self, handler, event, data):
+        counter = [0]
+        token = current_queries.set(counter)
+        try:
+            return await handler(event, data)
+        finally:
+            current_queries.reset(token)
+            self.updates += 1
+            self.update_queries += counter[0]
+
+    async def handler_middleware(self, handler, event, data):
+        name = data['handler'].callback.__name__
+        counter = current_queries.get()
+        before = counter[0] if counter else 0
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            self.latencies[name].append(time.perf_counter() - started)
+            self.queries[name] += (counter[0] if counter else 0) - before
+
+
+class Simulator:
+    def __init__(self, dp, bot, pages_hosts: list[str], pages_port: int, links_per_message: int):
+        self.dp = dp
+        self.bot = bot
+        self.pages_hosts = pages_hosts
+        self.pages_port = pages_port
+        self.links_per_message = links_per_message
+        self._update_ids = itertools.count(1)
+        self._page_ids = itertools.count(1)
+
+    def _update(self, userid: int, text: str, entities=None):
+        from aiogram.types import Update, Message, Chat, User
+
+        update_id = next(self._update_ids)
+        return Update(update_id=update_id, message=Message(
+            message_id=update_id,
+            date=datetime.datetime.now(),
+            chat=Chat(id=userid, type='private'),
+            from_user=User(id=userid, is_bot=False, first_name=f'User {userid}', username=f'user{userid}'),
+            text=text,
+            entities=entities,
+        ))
+
+    def _links_message(self, userid: int):
+        from aiogram.types import MessageEntity
+
+        parts, entities, offset = [], [], 0
+        for _ in range(self.links_per_message):
+            number = next(self._page_ids)
+            link = f'http://{self.pages_hosts[number % len(self.pages_hosts)]}:{self.pages_port}/page/{number}'
+            prefix = 'Смотри ' if not parts else ' и '
+            entities.append(MessageEntity(type='url', offset=offset + len(prefix), length=len(link)))
+            parts.append(prefix + link)
+            offset += len(prefix + link)
+        return self._update(userid, ''.join(parts), entities)
+
+    async def send(self, update) -> None:
+        await self.dp.feed_update(self.bot, update)
+
+    async def user_session(self, userid: int, rounds: int) -> None:
+        for round_number in range(rounds):
+            await self.send(self._links_message(userid))
+            if self.links_per_message > 1:
+                await self.send(self._update(userid, ' '.join(str(i + 1) for i in range(self.links_per_message))))
+            if round_number == 0:
+                await self.send(self._update(userid, 'создать новую'))
+                await self.send(self._update(userid, f'bench-{userid}'))
+            else:
+                await self.send(self._update(userid, f'bench-{userid}'))
+            await self.send(self._update(userid, str(round_number % 10 + 1)))
+            await self.send(self._update(userid, '/links'))
+            await self.send(self._update(userid, f'bench-{userid}'))
+
+
+async def run(args) -> dict:
+    from sqlalchemy import event, func
+    from sqlalchemy.future import select
+    from aiogram import Bot, Dispatcher
+
+    from tgbot.__main__ import setup_storage, setup_aiogram
+    from tgbot.database.database import AsyncSessionLocal, async_engine, init_db, User, NotionOutbox
+    from tgbot.services.metadata import metadata_fetcher
+    from tgbot.services.notion import notion_pool
+    from tgbot.services.notion_queue import notion_outbox
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    notion_stats = {'pages': 0}
+    # every loopback address counts as its own domain for the per-domain metadata limit
+    pages_hosts = [f'127.0.0.{i + 1}' for i in range(args.page_hosts)]
+    pages_runner = await start_pages_server(pages_hosts, args.pages_port, args.page_delay)
+    notion_runner = await start_notion_server(args.notion_port, args.notion_delay, notion_stats)
+
+    recorder = Recorder()
+    event.listen(async_engine.sync_engine, 'before_cursor_execute', recorder.on_execute)
+
+    await init_db()
+    userids = list(range(1, args.users + 1))
+    async with AsyncSessionLocal() as session:
+        session.add_all([
+            User(userid=userid, fullname=f'User {userid}', username=f'user{userid}',
+                 token=f'secret_bench_{userid}', notion_db_id=str(uuid.uuid4()))
+            for userid in userids
+        ])
+        await session.commit()
+    recorder.background_queries = 0
+
+    bot = Bot(token='42:BENCHMARK', session=build_session_class()())
+    dp = Dispatcher(storage=setup_storage())
+    dp.update.outer_middleware(recorder.update_middleware)
+    await setup_aiogram(dp)
+    dp.message.middleware(recorder.handler_middleware)
+    notion_outbox.start()
+
+    simulator = Simulator(dp, bot, pages_hosts, args.pages_port, args.links_per_message)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def limited(userid):
+        async with semaphore:
+            await simulator.user_session(userid, args.rounds)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(limited(userid) for userid in userids))
+    duration = time.perf_counter() - started
+
+    drain_started = time.perf_counter()
+    while True:
+        async with AsyncSessionLocal() as session:
+            pending = (await session.execute(select(func.count()).select_from(NotionOutbox))).scalar()
+        if not pending or time.perf_counter() - drain_started > args.drain_timeout:
+            break
+        notion_outbox.wake()
+        await asyncio.sleep(0.2)
+    drain = time.perf_counter() - drain_started
+
+    await notion_outbox.stop()
+    await dp.storage.close()
+    await notion_pool.close()
+    await metadata_fetcher.close()
+    await async_engine.dispose()
+    await pages_runner.cleanup()
+    await notion_runner.cleanup()
+
+    return {
+        'meta': {
+            'commit': _commit(),
+            'python': platform.python_version(),
+            'database': async_engine.url.get_backend_name(),
+            'fsm_storage': type(dp.storage).__name__,
+            'users': args.users,
+            'rounds': args.rounds,
+            'concurrency': args.concurrency,
+            'links_per_message': args.links_per_message,
+            'page_hosts': args.page_hosts,
+            'page_delay_s': args.page_delay,
+            'notion_delay_s': args.notion_delay,
+        },
+        'updates': recorder.updates,
+        'duration_s': round(duration, 3),
+        'updates_per_s': round(recorder.updates / duration, 1),
+        'db_queries_per_update': round(recorder.update_queries / max(recorder.updates, 1), 2),
+        'background_db_queries': recorder.background_queries,
+        'bot_api_calls': dict(bot.session.calls),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'handlers': {
+            name: {**_summary(recorder.latencies[name]),
+                   'db_queries_per_call': round(recorder.queries[name] / max(len(recorder.latencies[name]), 1), 2)}
+            for name in HANDLERS if recorder.latencies[name]
+        },
+        'notion': {
+            'pages_created': notion_stats['pages'],
+            'pending_after_drain': pending,
+            'drain_s': round(drain, 3),
+        },
+    }
+
+
+def _commit() -> str | None:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(result: dict, baseline: dict) -> None:
+    def change(new, old):
+        if not old or new is None:
+            return ''
+        return f'{(new - old) / old * 100:+.1f}%'
+
+    print(f'baseline {baseline["meta"].get("commit")} -> {result["meta"].get("commit")}', file=sys.stderr)
+    for key in ('updates_per_s', 'db_queries_per_update', 'peak_rss_mb'):
+        print(f'  {key:<28}{baseline[key]:>10} -> {result[key]:<10}{change(result[key], baseline[key])}', file=sys.stderr)
+    for name, stats in result['handlers'].items():
+        old = baseline['handlers'].get(name)
+        if old:
+            print(f'  {name + " p95_ms":<28}{old["p95_ms"]:>10} -> {stats["p95_ms"]:<10}{change(stats["p95_ms"], old["p95_ms"])}',
+                  file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--rounds', type=int, default=3, help='save-and-list cycles per user')
+    parser.add_argument('--concurrency', type=int, default=50, help='users active at the same time')
+    parser.add_argument('--links-per-message', type=int, default=3)
+    parser.add_argument('--page-hosts', type=int, default=16, help='loopback addresses the linked pages are spread over')
+    parser.add_argument('--page-delay', type=float, default=0.05, help='response delay of the pages server, seconds')
+    parser.add_argument('--notion-delay', type=float, default=0.1, help='response delay of the fake Notion API, seconds')
+    parser.add_argument('--drain-timeout', type=float, default=60, help='how long to wait for the Notion outbox to empty')
+    parser.add_argument('--database-url', default=None, help='defaults to a temporary SQLite file')
+    parser.add_argument('--output', help='write the JSON result here instead of stdout')
+    parser.add_argument('--baseline', help='previous JSON result to compare against')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-')
+    args.pages_port = _free_port()
+    args.notion_port = _free_port()
+    # config is read at import time, so the environment must be ready before tgbot is imported
+    os.environ['DATABASE_URL'] = args.database_url or f'sqlite+aiosqlite:///{os.path.join(workdir, "bench.db")}'
+    os.environ['NOTION_BASE_URL'] = f'http://127.0.0.1:{args.notion_port}'
+    os.environ.setdefault('BOT_TOKEN', '42:BENCHMARK')
+
+    result = asyncio.run(run(args))
+    output = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output + '\n')
+    else:
+        print(output)
+    if args.baseline:
+        with open(args.baseline) as file:
+            compare(result, json.load(file))
+
+
+if __name__ == '__main__':
+    main()
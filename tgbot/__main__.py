@@ -6,11 +6,18 @@ from aiogram import Bot, Dispatcher
 from aiogram.client.bot import DefaultBotProperties
 from aiogram.client.session.aiohttp import AiohttpSession
 from aiogram.enums import ParseMode
-from aiogram.fsm.storage.memory import MemoryStorage
-from tgbot.models.models import Users, Tokens, Links
-from tgbot import handlers
+from aiogram.fsm.storage.base import BaseStorage
+from tgbot import handlers, middlewares
 from tgbot.data import config
-from tgbot.database.database import AsyncSessionLocal, init_db
+from tgbot.database.database import AsyncSessionLocal, async_engine, init_db
+from tgbot.services.notion import notion_pool
+from tgbot.services.notion_queue import notion_outbox
+from tgbot.services.metadata import metadata_fetcher
+from tgbot.services.importer import link_importer
+from tgbot.services.metrics import metrics_server, setup_metrics
+from tgbot.services.query_log import query_log
+from tgbot.services.storage import DatabaseStorage, ExpiringMemoryStorage
+from tgbot.services.webhook import run_webhook
 
 
 async def setup_logging():
@@ -20,12 +27,28 @@ async def setup_logging():
     logger.info("Starting bot")
 
 
+def setup_storage() -> BaseStorage:
+    if config.FSM_STORAGE == 'memory':
+        return ExpiringMemoryStorage(ttl=config.FSM_TTL, sweep_interval=config.FSM_SWEEP_INTERVAL)
+    if config.FSM_STORAGE == 'redis':
+        from aiogram.fsm.storage.redis import RedisStorage
+        return RedisStorage.from_url(config.FSM_REDIS_URL, state_ttl=int(config.FSM_TTL), data_ttl=int(config.FSM_TTL))
+    return DatabaseStorage(
+        AsyncSessionLocal,
+        flush_interval=config.FSM_FLUSH_INTERVAL,
+        cache_ttl=config.FSM_CACHE_TTL,
+        cache_size=config.FSM_CACHE_SIZE,
+        ttl=config.FSM_TTL,
+        sweep_interval=config.FSM_SWEEP_INTERVAL,
+    )
+
+
 async def setup_handlers(dp: Dispatcher) -> None:
     dp.include_router(handlers.setup())
 
 
 async def setup_middlewares(dp: Dispatcher) -> None:
-    pass
+    middlewares.setup(dp)
 
 
 async def setup_aiogram(dp: Dispatcher) -> None:
@@ -35,28 +58,29 @@ async def setup_aiogram(dp: Dispatcher) -> None:
 
 async def aiogram_on_startup_polling(dispatcher: Dispatcher, bot: Bot) -> None:
     try:
-        pool = AsyncSessionLocal()
-        token_model = Tokens(pool)
-        user_model = Users(pool)
-        link_model = Links(pool)
-
-        dispatcher['db'] = pool
-        dispatcher['usermodel'] = user_model
-        dispatcher['tokenmodel'] = token_model
-        dispatcher['linkmodel'] = link_model
-
+        setup_metrics(async_engine)
+        query_log.instrument(async_engine)
         await init_db()
         await setup_aiogram(dispatcher)
+        await metrics_server.start()
+        notion_outbox.start()
         logging.info("Bot started")
     except Exception as e:
+        # without a schema or handlers the bot would keep polling and silently drop every update
         logging.error(f'Error during startup: {e}')
+        raise
 
 
 async def aiogram_on_shutdown_polling(dispatcher: Dispatcher, bot: Bot) -> None:
     try:
-        await dispatcher['db'].close()
-        await bot.session.close()
+        await link_importer.stop()
+        await notion_outbox.stop()
         await dispatcher.storage.close()
+        await async_engine.dispose()
+        await notion_pool.close()
+        await metadata_fetcher.close()
+        await metrics_server.stop()
+        await bot.session.close()
         logging.info("Bot shutdown")
     except Exception as e:
         logging.error(f'error542678: {e}')
@@ -75,7 +99,7 @@ async def main():
             default=DefaultBotProperties(parse_mode=ParseMode.HTML)
         )
 
-        storage = MemoryStorage()
+        storage = setup_storage()
 
         dp = Dispatcher(
             storage=storage,
@@ -84,7 +108,11 @@ async def main():
         dp.startup.register(aiogram_on_startup_polling)
         dp.shutdown.register(aiogram_on_shutdown_polling)
 
-        await dp.start_polling(bot)
+        if config.BOT_MODE == 'webhook':
+            await run_webhook(dp, bot)
+        else:
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
     except Exception as e:
         logging.error(f'error6247423: {e}')
 
@@ -4,6 +4,101 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+
+def _getbool(name: str, default: bool) -> bool:
+    return os.getenv(name, str(default)).strip().lower() in {'1', 'true', 'yes', 'on'}
+
+
 BOT_TOKEN: str = os.getenv('BOT_TOKEN')
 
 DATABASE_URL: str = os.getenv('DATABASE_URL')
+DB_ECHO: bool = _getbool('DB_ECHO', False)
+# statements slower than DB_SLOW_QUERY_MS are logged, DB_SLOW_QUERY_SAMPLE of them
+DB_SLOW_QUERY_MS: float = float(os.getenv('DB_SLOW_QUERY_MS', 100))
+DB_SLOW_QUERY_SAMPLE: float = float(os.getenv('DB_SLOW_QUERY_SAMPLE', 1.0))
+# warn when one update runs the same query shape this many times
+DB_REPEATED_QUERY_THRESHOLD: int = int(os.getenv('DB_REPEATED_QUERY_THRESHOLD', 3))
+# log a per-update statement summary
+DB_QUERY_REPORT: bool = _getbool('DB_QUERY_REPORT', False)
+DB_POOL_SIZE: int = int(os.getenv('DB_POOL_SIZE', 10))
+DB_MAX_OVERFLOW: int = int(os.getenv('DB_MAX_OVERFLOW', 20))
+DB_POOL_TIMEOUT: float = float(os.getenv('DB_POOL_TIMEOUT', 30))
+DB_POOL_RECYCLE: int = int(os.getenv('DB_POOL_RECYCLE', 1800))
+DB_POOL_PRE_PING: bool = _getbool('DB_POOL_PRE_PING', True)
+# asyncpg prepared statement cache; set to 0 behind pgbouncer in transaction mode
+DB_STATEMENT_CACHE_SIZE: int = int(os.getenv('DB_STATEMENT_CACHE_SIZE', 100))
+
+# the database/page calls below use the pre data-source API
+NOTION_VERSION: str = os.getenv('NOTION_VERSION', '2022-06-28')
+NOTION_BASE_URL: str = os.getenv('NOTION_BASE_URL', 'https://api.notion.com')
+NOTION_TIMEOUT: float = float(os.getenv('NOTION_TIMEOUT', 30))
+NOTION_MAX_CONNECTIONS: int = int(os.getenv('NOTION_MAX_CONNECTIONS', 20))
+NOTION_MAX_KEEPALIVE: int = int(os.getenv('NOTION_MAX_KEEPALIVE', 10))
+NOTION_CLIENT_CACHE_SIZE: int = int(os.getenv('NOTION_CLIENT_CACHE_SIZE', 1000))
+NOTION_CLIENT_TTL: float = float(os.getenv('NOTION_CLIENT_TTL', 3600))
+
+NOTION_QUEUE_WORKERS: int = int(os.getenv('NOTION_QUEUE_WORKERS', 2))
+NOTION_QUEUE_BATCH_SIZE: int = int(os.getenv('NOTION_QUEUE_BATCH_SIZE', 20))
+NOTION_QUEUE_POLL_INTERVAL: float = float(os.getenv('NOTION_QUEUE_POLL_INTERVAL', 5))
+NOTION_QUEUE_MAX_ATTEMPTS: int = int(os.getenv('NOTION_QUEUE_MAX_ATTEMPTS', 8))
+NOTION_QUEUE_LEASE: float = float(os.getenv('NOTION_QUEUE_LEASE', 120))
+# Notion allows an average of three requests per second per integration
+NOTION_RATE_LIMIT: float = float(os.getenv('NOTION_RATE_LIMIT', 3))
+
+METADATA_CONNECT_TIMEOUT: float = float(os.getenv('METADATA_CONNECT_TIMEOUT', 5))
+METADATA_READ_TIMEOUT: float = float(os.getenv('METADATA_READ_TIMEOUT', 10))
+METADATA_TOTAL_TIMEOUT: float = float(os.getenv('METADATA_TOTAL_TIMEOUT', 20))
+METADATA_MAX_BYTES: int = int(os.getenv('METADATA_MAX_BYTES', 512 * 1024))
+METADATA_MAX_CONNECTIONS: int = int(os.getenv('METADATA_MAX_CONNECTIONS', 100))
+METADATA_MAX_CONNECTIONS_PER_HOST: int = int(os.getenv('METADATA_MAX_CONNECTIONS_PER_HOST', 10))
+
+METADATA_CACHE_SIZE: int = int(os.getenv('METADATA_CACHE_SIZE', 10000))
+METADATA_CACHE_TTL: float = float(os.getenv('METADATA_CACHE_TTL', 6 * 3600))
+METADATA_CACHE_NEGATIVE_TTL: float = float(os.getenv('METADATA_CACHE_NEGATIVE_TTL', 300))
+METADATA_CONCURRENCY: int = int(os.getenv('METADATA_CONCURRENCY', 20))
+METADATA_PER_DOMAIN_CONCURRENCY: int = int(os.getenv('METADATA_PER_DOMAIN_CONCURRENCY', 2))
+
+BUSY_LOCK_TIMEOUT: float = float(os.getenv('BUSY_LOCK_TIMEOUT', 300))
+# how long the first message of an album waits for the other parts
+ALBUM_LATENCY: float = float(os.getenv('ALBUM_LATENCY', 0.6))
+
+LINKS_PAGE_SIZE: int = int(os.getenv('LINKS_PAGE_SIZE', 10))
+
+CATEGORY_CACHE_SIZE: int = int(os.getenv('CATEGORY_CACHE_SIZE', 10000))
+CATEGORY_CACHE_TTL: float = float(os.getenv('CATEGORY_CACHE_TTL', 3600))
+
+# database (default), redis or memory
+FSM_STORAGE: str = os.getenv('FSM_STORAGE', 'database')
+FSM_REDIS_URL: str = os.getenv('FSM_REDIS_URL', 'redis://localhost:6379/0')
+FSM_FLUSH_INTERVAL: float = float(os.getenv('FSM_FLUSH_INTERVAL', 0.1))
+# set to 0 when several workers receive updates for the same user
+FSM_CACHE_TTL: float = float(os.getenv('FSM_CACHE_TTL', 10))
+FSM_CACHE_SIZE: int = int(os.getenv('FSM_CACHE_SIZE', 10000))
+# abandoned flows are dropped after FSM_TTL seconds without activity
+FSM_TTL: float = float(os.getenv('FSM_TTL', 24 * 3600))
+FSM_SWEEP_INTERVAL: float = float(os.getenv('FSM_SWEEP_INTERVAL', 600))
+
+# polling or webhook
+BOT_MODE: str = os.getenv('BOT_MODE', 'polling')
+WEBHOOK_URL: str = os.getenv('WEBHOOK_URL')
+WEBHOOK_PATH: str = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_SECRET: str = os.getenv('WEBHOOK_SECRET')
+WEBHOOK_HOST: str = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT: int = int(os.getenv('WEBHOOK_PORT', 8080))
+WEBHOOK_MAX_IN_FLIGHT: int = int(os.getenv('WEBHOOK_MAX_IN_FLIGHT', 100))
+WEBHOOK_MAX_CONNECTIONS: int = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', 40))
+
+NOTION_SYNC_PAGE_SIZE: int = int(os.getenv('NOTION_SYNC_PAGE_SIZE', 100))
+
+# Telegram bots can only download files up to 20 MB
+IMPORT_MAX_FILE_SIZE: int = int(os.getenv('IMPORT_MAX_FILE_SIZE', 20 * 1024 * 1024))
+IMPORT_BATCH_SIZE: int = int(os.getenv('IMPORT_BATCH_SIZE', 1000))
+IMPORT_PROGRESS_INTERVAL: float = float(os.getenv('IMPORT_PROGRESS_INTERVAL', 3))
+# files waiting for the running import of the same user, a Telegram album holds up to 10
+IMPORT_MAX_QUEUED: int = int(os.getenv('IMPORT_MAX_QUEUED', 10))
+
+EXPORT_YIELD_PER: int = int(os.getenv('EXPORT_YIELD_PER', 1000))
+
+# Prometheus endpoint at http://METRICS_HOST:METRICS_PORT/metrics, 0 disables it
+METRICS_HOST: str = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT: int = int(os.getenv('METRICS_PORT', 0))
@@ -1,15 +1,56 @@
-from sqlalchemy import BigInteger, String, Text, Boolean, TIMESTAMP, Integer, ForeignKey, UniqueConstraint, Column
+from sqlalchemy import BigInteger, String, Text, Boolean, TIMESTAMP, Integer, ForeignKey, UniqueConstraint, Column, LargeBinary, Index, bindparam, inspect, or_, select, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
-from sqlalchemy.sql import func
-import os
-import logging
-from dotenv import load_dotenv
-load_dotenv()
+from sqlalchemy.sql import func, text
+from tgbot.data import config
+from tgbot.services.urls import url_hash
 
 Base = declarative_base()
 
+# SQLite only autoincrements INTEGER PRIMARY KEY (rowid alias) columns
+BigIntegerPK = BigInteger().with_variant(Integer, 'sqlite')
+
+LINK_SEARCH_VECTOR = "to_tsvector('simple', coalesce(links.title, '') || ' ' || coalesce(links.source, ''))"
+CATEGORY_SEARCH_VECTOR = "to_tsvector('simple', coalesce(userlinks.category, ''))"
+
+SEARCH_DDL = {
+    'postgresql': [
+        f"CREATE INDEX IF NOT EXISTS ix_links_search ON links USING gin ({LINK_SEARCH_VECTOR})",
+        f"CREATE INDEX IF NOT EXISTS ix_userlinks_category_search ON userlinks USING gin ({CATEGORY_SEARCH_VECTOR})",
+    ],
+    'sqlite': [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS links_fts USING fts5(title, source, content='links', content_rowid='linkid')",
+        "CREATE TRIGGER IF NOT EXISTS links_fts_ai AFTER INSERT ON links BEGIN "
+        "INSERT INTO links_fts(rowid, title, source) VALUES (new.linkid, new.title, new.source); END",
+        "CREATE TRIGGER IF NOT EXISTS links_fts_ad AFTER DELETE ON links BEGIN "
+        "INSERT INTO links_fts(links_fts, rowid, title, source) VALUES ('delete', old.linkid, old.title, old.source); END",
+        "CREATE TRIGGER IF NOT EXISTS links_fts_au AFTER UPDATE ON links BEGIN "
+        "INSERT INTO links_fts(links_fts, rowid, title, source) VALUES ('delete', old.linkid, old.title, old.source); "
+        "INSERT INTO links_fts(rowid, title, source) VALUES (new.linkid, new.title, new.source); END",
+        "CREATE VIRTUAL TABLE IF NOT EXISTS userlinks_fts USING fts5(category, content='userlinks', content_rowid='userlinkid')",
+        "CREATE TRIGGER IF NOT EXISTS userlinks_fts_ai AFTER INSERT ON userlinks BEGIN "
+        "INSERT INTO userlinks_fts(rowid, category) VALUES (new.userlinkid, new.category); END",
+        "CREATE TRIGGER IF NOT EXISTS userlinks_fts_ad AFTER DELETE ON userlinks BEGIN "
+        "INSERT INTO userlinks_fts(userlinks_fts, rowid, category) VALUES ('delete', old.userlinkid, old.category); END",
+        "CREATE TRIGGER IF NOT EXISTS userlinks_fts_au AFTER UPDATE OF category ON userlinks BEGIN "
+        "INSERT INTO userlinks_fts(userlinks_fts, rowid, category) VALUES ('delete', old.userlinkid, old.category); "
+        "INSERT INTO userlinks_fts(rowid, category) VALUES (new.userlinkid, new.category); END",
+    ],
+}
+# columns added to tables that older installs already have; create_all never alters an existing table
+ADDED_COLUMNS = [
+    ('userlinks', 'notion_page_id'),
+    ('userlinks', 'notion_status'),
+    ('links', 'url_hash'),
+    ('users', 'notion_cursor'),
+]
+
+# external content FTS tables start empty, so they are rebuilt once when first created
+SQLITE_FTS_TABLES = ('links_fts', 'userlinks_fts')
+
 class User(Base):
     __tablename__ = 'users'
     userid = Column(BigInteger, primary_key=True)
@@ -20,27 +61,43 @@ class User(Base):
     added = Column(TIMESTAMP(timezone=True), server_default=func.now())
     updated = Column(TIMESTAMP(timezone=True), server_default=func.now())
     waiting = Column(Boolean, default=False)
+    notion_cursor = Column(TIMESTAMP(timezone=True))
 
 class Link(Base):
     __tablename__ = 'links'
 
-    linkid = Column(BigInteger, primary_key=True, autoincrement=True)
+    linkid = Column(BigIntegerPK, primary_key=True, autoincrement=True)
     link = Column(Text, unique=True)
+    url_hash = Column(LargeBinary(32))
     title = Column(Text)
     category = Column(Text, default='other')
     source = Column(Text, default='other')
     added_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
+    # a unique index rather than a constraint, so init_db can add it to an existing table
+    __table_args__ = (Index('ix_links_url_hash', 'url_hash', unique=True),)
 
 
 class UserLink(Base):
     __tablename__ = 'userlinks'
 
-    userlinkid = Column(BigInteger, primary_key=True, autoincrement=True)
+    userlinkid = Column(BigIntegerPK, primary_key=True, autoincrement=True)
     userid = Column(BigInteger, ForeignKey('users.userid'))
     linkid = Column(BigInteger, ForeignKey('links.linkid'))
     category = Column(Text, default='other')
     priority = Column(Integer)
-    __table_args__ = (UniqueConstraint('userid', 'linkid'),)
+    notion_page_id = Column(Text)
+    notion_status = Column(Text)
+    __table_args__ = (
+        UniqueConstraint('userid', 'linkid'),
+        Index('ix_userlinks_userid_userlinkid', 'userid', 'userlinkid'),
+        Index('ix_userlinks_userid_category_userlinkid', 'userid', 'category', 'userlinkid'),
+        Index('ix_userlinks_notion_page_id', 'notion_page_id'),
+        Index(
+            'ix_userlinks_userid_unsynced', 'userid',
+            postgresql_where=text('notion_page_id IS NULL'),
+            sqlite_where=text('notion_page_id IS NULL'),
+        ),
+    )
 
 
 class ForwardFrom(Base):
@@ -52,13 +109,140 @@ class ForwardFrom(Base):
     type = Column(Text)
 
 
-async_engine = create_async_engine(os.getenv("DATABASE_URL"), echo=True)
+class NotionOutbox(Base):
+    __tablename__ = 'notion_outbox'
+
+    jobid = Column(BigIntegerPK, primary_key=True, autoincrement=True)
+    userlinkid = Column(BigInteger, ForeignKey('userlinks.userlinkid', ondelete='CASCADE'), index=True)
+    userid = Column(BigInteger, ForeignKey('users.userid'))
+    action = Column(Text, default='create')
+    notion_page_id = Column(Text)
+    attempts = Column(Integer, default=0)
+    last_error = Column(Text)
+    available_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), index=True)
+    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
+    # workers delete finished jobs by id, so SQLite must never hand a deleted job's id to a new one
+    __table_args__ = {'sqlite_autoincrement': True}
+
+
+class FSMRecord(Base):
+    __tablename__ = 'fsm_storage'
+
+    key = Column(Text, primary_key=True)
+    state = Column(Text)
+    data = Column(Text)
+    updated_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+def _engine_options() -> dict:
+    options = {
+        'echo': config.DB_ECHO,
+        'pool_pre_ping': config.DB_POOL_PRE_PING,
+    }
+    if config.DATABASE_URL.startswith('postgresql'):
+        options.update(
+            pool_size=config.DB_POOL_SIZE,
+            max_overflow=config.DB_MAX_OVERFLOW,
+            pool_timeout=config.DB_POOL_TIMEOUT,
+            pool_recycle=config.DB_POOL_RECYCLE,
+        )
+    if config.DATABASE_URL.startswith('postgresql+asyncpg'):
+        options['connect_args'] = {
+            'prepared_statement_cache_size': config.DB_STATEMENT_CACHE_SIZE,
+            'statement_cache_size': config.DB_STATEMENT_CACHE_SIZE,
+        }
+    return options
+
+
+async_engine = create_async_engine(config.DATABASE_URL, **_engine_options())
 
 AsyncSessionLocal = sessionmaker(async_engine, expire_on_commit=False, class_=AsyncSession)
 
 async def init_db():
     async with async_engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_migrate_schema)
+        created_fts = []
+        if conn.dialect.name == 'sqlite':
+            existing = set((await conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'table'")).scalars())
+            created_fts = [name for name in SQLITE_FTS_TABLES if name not in existing]
+        for statement in SEARCH_DDL.get(conn.dialect.name, []):
+            await conn.exec_driver_sql(statement)
+        for name in created_fts:
+            await conn.exec_driver_sql(f"INSERT INTO {name}({name}) VALUES ('rebuild')")
+        await _backfill_url_hashes(conn)
+
+def _migrate_schema(conn) -> None:
+    inspector = inspect(conn)
+    existing = {}
+    for table_name, column_name in ADDED_COLUMNS:
+        if table_name not in existing:
+            existing[table_name] = {column['name'] for column in inspector.get_columns(table_name)}
+        if column_name in existing[table_name]:
+            continue
+        column = Base.metadata.tables[table_name].c[column_name]
+        conn.exec_driver_sql(f'ALTER TABLE {table_name} ADD COLUMN {column.name} {column.type.compile(conn.dialect)}')
+
+    # indexes declared on tables that create_all found already in place
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+async def _backfill_url_hashes(conn) -> None:
+    # links saved before url_hash existed; a row whose canonical form another row already has keeps NULL
+    # and is found by its raw link in upsert_links
+    rows = (await conn.execute(select(Link.linkid, Link.link).where(Link.url_hash.is_(None)))).all()
+    hashes = {}
+    for row in rows:
+        try:
+            hashes.setdefault(url_hash(row.link), row.linkid)
+        except (ValueError, AttributeError):
+            continue
+
+    pending = list(hashes)
+    taken = set()
+    for start in range(0, len(pending), 500):
+        chunk = pending[start:start + 500]
+        taken.update((await conn.execute(select(Link.url_hash).where(Link.url_hash.in_(chunk)))).scalars())
+
+    updates = [{'b_linkid': linkid, 'b_url_hash': link_hash} for link_hash, linkid in hashes.items() if link_hash not in taken]
+    if updates:
+        await conn.execute(
+            update(Link).where(Link.linkid == bindparam('b_linkid')).values(url_hash=bindparam('b_url_hash')),
+            updates,
+        )
+
+def dialect_insert(session: AsyncSession, model):
+    # INSERT ... ON CONFLICT needs the dialect-specific construct
+    if session.bind.dialect.name == 'sqlite':
+        return sqlite_insert(model)
+    return postgresql_insert(model)
+
+async def upsert_links(session: AsyncSession, rows: list[dict]) -> dict[bytes, int]:
+    # rows carry at least link and url_hash; returns url_hash -> linkid for new and already stored links
+    rows = list({row['url_hash']: row for row in rows}.values())
+    if not rows:
+        return {}
+    result = await session.execute(
+        dialect_insert(session, Link).on_conflict_do_nothing().returning(Link.linkid, Link.url_hash),
+        rows,
+    )
+    linkids = {row.url_hash: row.linkid for row in result}
+
+    missing = [row for row in rows if row['url_hash'] not in linkids]
+    if missing:
+        hashes = {row['url_hash'] for row in missing}
+        by_link = {row['link']: row['url_hash'] for row in missing}
+        existing = (await session.execute(
+            select(Link.linkid, Link.url_hash, Link.link).where(or_(Link.url_hash.in_(hashes), Link.link.in_(by_link)))
+        )).all()
+        for row in existing:
+            if row.url_hash in hashes:
+                linkids[row.url_hash] = row.linkid
+        for row in existing:
+            if row.link in by_link:
+                linkids.setdefault(by_link[row.link], row.linkid)
+    return linkids
 
 async def get_session():
     async with AsyncSessionLocal() as session:
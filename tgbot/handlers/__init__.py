@@ -9,8 +9,11 @@ from tgbot.handlers.commands import (
     handle_link_selection,
     handle_message_with_links,
     handle_category_selection,
-    handle_new_category, handle_get_links, handle_get_category, handle_refresh2, handle_refresh, handle_delete, handle_priority_selection
+    handle_new_category, handle_get_links, handle_get_category, handle_refresh2, handle_refresh, handle_delete, handle_delete2, handle_priority_selection,
+    handle_links_page, handle_search, handle_search_page, handle_import_document,
+    handle_export
 )
+from tgbot.keyboards.keyboards import LinksPage, SearchPage
 from tgbot.states.states import UserStages
 
 def setup() -> Router:
@@ -23,12 +26,18 @@ def setup() -> Router:
     router.message.register(handle_get_links, Command('links'))
     router.message.register(handle_refresh, Command('refresh'))
     router.message.register(handle_delete, Command('deletelinks'))
+    router.message.register(handle_search, Command('search'))
+    router.message.register(handle_export, Command('export'))
+    router.message.register(handle_import_document, lambda message: message.content_type == ContentType.DOCUMENT)
     router.message.register(handle_link_selection, StateFilter(UserStages.link_selection))
     router.message.register(handle_category_selection, StateFilter(UserStages.category_selection))
     router.message.register(handle_new_category, StateFilter(UserStages.new_category))
     router.message.register(handle_get_category, StateFilter(UserStages.get_category))
     router.message.register(handle_refresh2, StateFilter(UserStages.yes_no))
     router.message.register(handle_priority_selection, UserStages.select_priority)
+    router.message.register(handle_delete2, StateFilter(UserStages.delete_confirm))
+    router.callback_query.register(handle_links_page, LinksPage.filter())
+    router.callback_query.register(handle_search_page, SearchPage.filter())
 
 
     router.message.register(
@@ -1,25 +1,29 @@
-from aiogram import types
+from aiogram import Bot, types
+from aiogram.filters import CommandObject
 from aiogram.fsm.context import FSMContext
+import html
 import logging
+import os
+import tempfile
 import betterlogging as bl
 import re
 from tgbot.states.states import UserStages
-from tgbot.keyboards.keyboards import get_add_token_keyboard, get_category_keyboard, get_yes_no_keyboard, get_get_links_category_keyboard, get_priority_keyboard
-from aiogram.types import ReplyKeyboardRemove
+from tgbot.models.models import Users, Tokens, Links
+from tgbot.middlewares.busy import UserBusyLock, BUSY_MESSAGE
+from tgbot.services.importer import link_importer, import_kind
+from tgbot.services.export import write_export, EXPORT_FORMATS
+from tgbot.services.urls import extract_links
+from tgbot.keyboards.keyboards import get_add_token_keyboard, get_category_keyboard, get_yes_no_keyboard, get_get_links_category_keyboard, get_priority_keyboard, get_links_page_keyboard, LinksPage, get_search_page_keyboard, SearchPage
+from tgbot.data import config
+from aiogram.types import ReplyKeyboardRemove, FSInputFile
 log_level = logging.INFO
 bl.basic_colorized_config(level=log_level)
 logger = logging.getLogger(__name__)
 logger.info("Starting bot")
 
-async def start_command_handler(message: types.Message, state: FSMContext, dispatcher):
+async def start_command_handler(message: types.Message, state: FSMContext, usermodel: Users):
     from_user = message.from_user
 
-    usermodel = dispatcher['usermodel']
-    is_waiting = await usermodel.is_waiting(from_user.id)
-    if is_waiting:
-        await message.answer('Пожалуйста, дождитесь ответа на предыдущий запрос.')
-        return
-
     token = await usermodel.check_token_db(from_user)
     try:
         if token is None:
@@ -56,48 +60,35 @@ async def command_token(message: types.Message, state: FSMContext):
         logger.error(f'error12345: {e}')
 
 
-async def handle_add_token(message: types.Message, state: FSMContext, dispatcher):
-    usermodel = dispatcher['usermodel']
-    tokenmodel = dispatcher['tokenmodel']
-
-    is_waiting = await usermodel.is_waiting(message.from_user.id)
-    if is_waiting:
-        await message.answer('Пожалуйста, дождитесь ответа на предыдущий запрос.')
-        return
-
+async def handle_add_token(message: types.Message, state: FSMContext, tokenmodel: Tokens, busy: UserBusyLock):
     try:
-        await usermodel.update_waiting(message.from_user.id)
-        await message.answer('Мы передали токен на проверку, пожалуйста, подождите.')
-
-        result = await tokenmodel.add_token(message.from_user.id, message.text)
-        if result:
-            await message.answer("Токен успешно добавлен.")
-        else:
-            await message.answer("Токен не прошел проверку и запрос был отклонен.\n\n<b>Совет: попробуйте создать страницу с названием (linksinbot) и убедитесь в том что подключили токен</b>",parse_mode='HTML')
+        async with busy.hold(message.from_user.id) as acquired:
+            if not acquired:
+                await message.answer(BUSY_MESSAGE)
+                return
+            await message.answer('Мы передали токен на проверку, пожалуйста, подождите.')
+
+            result = await tokenmodel.add_token(message.from_user.id, message.text)
+            if result:
+                await message.answer("Токен успешно добавлен.")
+            else:
+                await message.answer("Токен не прошел проверку и запрос был отклонен.\n\n<b>Совет: попробуйте создать страницу с названием (linksinbot) и убедитесь в том что подключили токен</b>",parse_mode='HTML')
 
     except Exception as e:
         logger.error(f'error98472652: {e}')
     finally:
-        await usermodel.update_waiting(message.from_user.id)
         await state.clear()
 
 
-async def handle_message_with_links(message: types.Message, state: FSMContext, dispatcher):
-    usermodel = dispatcher['usermodel']
-
-    is_waiting = await usermodel.is_waiting(message.from_user.id)
-    if is_waiting:
-        await message.answer('Пожалуйста, дождитесь ответа на предыдущий запрос.')
-        return
-
+async def handle_message_with_links(message: types.Message, state: FSMContext, usermodel: Users, album: list[types.Message] | None = None):
     try:
-        text_content = message.text or message.caption
-
-        link_pattern = r'(https?://[^\s]+|www\.[^\s]+|[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}(?:/[^\s]*)?)'
-
-        links = re.findall(link_pattern, text_content)
-
-        unique_links = list(dict.fromkeys(links))
+        unique_links = []
+        for part in album or [message]:
+            if part.text is not None:
+                unique_links += extract_links(part.text, part.entities)
+            else:
+                unique_links += extract_links(part.caption, part.caption_entities)
+        unique_links = list(dict.fromkeys(unique_links))
 
         if not unique_links:
             await message.answer("В сообщении не найдено ссылок.")
@@ -110,7 +101,7 @@ async def handle_message_with_links(message: types.Message, state: FSMContext, d
 
             await message.answer(f'В какую категорию вы хотите сохранить выбранные ссылки?', reply_markup=keyboard)
             forword_data = await get_forward(message)
-            await state.update_data(selected_links=unique_links, forward_from= forword_data)
+            await state.update_data(links=unique_links, selected=[0], forward_from= forword_data)
             await state.set_state(UserStages.category_selection)
             return
         links_message = "Найдены ссылки:\n" + "\n\n".join([f"{i + 1}. {link}" for i, link in enumerate(unique_links)])
@@ -122,6 +113,39 @@ async def handle_message_with_links(message: types.Message, state: FSMContext, d
     except Exception as e:
         logger.error(f'error742865: {e}')
 
+async def handle_import_document(message: types.Message, bot: Bot, usermodel: Users):
+    userid = message.from_user.id
+    document = message.document
+
+    try:
+        kind = import_kind(document.file_name, document.mime_type)
+        if kind is None:
+            await message.answer('Можно импортировать закладки браузера (.html), экспорт чата Telegram (.json) или текстовый список ссылок (.txt).')
+            return
+        if document.file_size and document.file_size > config.IMPORT_MAX_FILE_SIZE:
+            await message.answer(f'Файл слишком большой, максимум {config.IMPORT_MAX_FILE_SIZE // (1024 * 1024)} МБ.')
+            return
+        if link_importer.is_full(userid):
+            await message.answer('Предыдущий импорт ещё не завершён.')
+            return
+
+        await usermodel.add_user(message.from_user)
+        fd, path = tempfile.mkstemp(prefix='import-', suffix=os.path.splitext(document.file_name or '')[1])
+        os.close(fd)
+        try:
+            await bot.download(document, destination=path)
+        except Exception:
+            os.remove(path)
+            raise
+
+        progress = await message.answer('Импорт начнётся после предыдущего...' if link_importer.is_running(userid) else 'Идёт импорт ссылок...')
+        category = (message.caption or '').strip() or None
+        link_importer.start(bot, userid, path, kind, category, progress)
+    except Exception as e:
+        logger.error(f'error7730141: {e}')
+        await message.answer('Не удалось загрузить файл. Попробуйте позже.')
+
+
 async def get_forward(message):
     try:
         if not message.forward_origin:
@@ -135,28 +159,22 @@ async def get_forward(message):
     except Exception as e:
         logger.error(f'error425y7224: {e}')
 
-async def handle_link_selection(message: types.Message, state: FSMContext, dispatcher):
-    usermodel = dispatcher['usermodel']
+async def handle_link_selection(message: types.Message, state: FSMContext, usermodel: Users):
     user_id = message.from_user.id
 
-    is_waiting = await usermodel.is_waiting(user_id)
-    if is_waiting:
-        await message.answer('Пожалуйста, дождитесь ответа на предыдущий запрос.')
-        return
-
     data = await state.get_data()
     links = data.get("links", [])
 
     try:
         selected_indexes = message.text.split()
-        selected_links = []
+        selected = []
         for index in selected_indexes:
             if index.isdigit():
                 idx = int(index) - 1
-                if 0 <= idx < len(links):
-                    selected_links.append(links[idx])
+                if 0 <= idx < len(links) and idx not in selected:
+                    selected.append(idx)
 
-        if not selected_links:
+        if not selected:
             await message.answer("Вы не выбрали ссылки для сохранения.")
             await state.clear()
             return
@@ -165,22 +183,14 @@ async def handle_link_selection(message: types.Message, state: FSMContext, dispa
 
         keyboard = get_category_keyboard(categories)
         await message.answer(f'В какую категорию вы хотите сохранить выбранные ссылки?', reply_markup=keyboard)
-        await state.update_data(selected_links=selected_links)
+        await state.update_data(selected=selected)
         await state.set_state(UserStages.category_selection)
     except Exception as e:
         logger.error(f'error742864: {e}')
         await message.answer("Произошла ошибка при обработке вашего выбора.")
 
 
-async def handle_category_selection(message: types.Message, state: FSMContext, dispatcher):
-    usermodel = dispatcher['usermodel']
-    user_id = message.from_user.id
-
-    is_waiting = await usermodel.is_waiting(user_id)
-    if is_waiting:
-        await message.answer('Пожалуйста, дождитесь ответа на предыдущий запрос.')
-        return
-
+async def handle_category_selection(message: types.Message, state: FSMContext):
     try:
         category = message.text
 
@@ -196,14 +206,7 @@ async def handle_category_selection(message: types.Message, state: FSMContext, d
         logger.error(f'error356263254: {e}')
 
 
-async def handle_new_category(message: types.Message, state: FSMContext, dispatcher):
-    usermodel = dispatcher['usermodel']
-    user_id = message.from_user.id
-
-    is_waiting = await usermodel.is_waiting(user_id)
-    if is_waiting:
-        await message.answer('Пожалуйста, дождитесь ответа на предыдущий запрос.')
-        return
+async def handle_new_category(message: types.Message, state: FSMContext):
     try:
         new_category = message.text
         if len(new_category) > 16:
@@ -219,51 +222,51 @@ async def handle_new_category(message: types.Message, state: FSMContext, dispatc
         logger.error(f'error7486542444: {e}')
 
 
-async def handle_priority_selection(message: types.Message, state: FSMContext, dispatcher):
-    usermodel = dispatcher['usermodel']
+async def handle_priority_selection(message: types.Message, state: FSMContext, usermodel: Users, linkmodel: Links, busy: UserBusyLock):
     user_id = message.from_user.id
 
-    is_waiting = await usermodel.is_waiting(user_id)
-    if is_waiting:
-        await message.answer('Пожалуйста, дождитесь ответа на предыдущий запрос.')
-        return
-
     try:
         priority = message.text
         if not priority.isdigit() or not (1 <= int(priority) <= 10):
             await message.answer("Пожалуйста, выберите приоритет числом от 1 до 10.")
             return
 
-        await usermodel.update_waiting(user_id)
-
-        data = await state.get_data()
-        selected_links = data.get("selected_links", [])
-        forward_from = data.get("forward_from", [])
-        category = data.get("category")
-        priority = int(priority)
-
-        await message.answer('Мы передали ссылку на проверку, пожалуйста, подождите.',reply_markup=ReplyKeyboardRemove())
-
-        for link in selected_links:
-            await usermodel.add_link(message.from_user, link, category, dispatcher, forward_from, priority=priority)
-
-        await message.answer(f"Выбранные ссылки успешно сохранены в категорию '{category}' с приоритетом {priority}.",reply_markup=ReplyKeyboardRemove())
+        async with busy.hold(user_id) as acquired:
+            if not acquired:
+                await message.answer(BUSY_MESSAGE)
+                return
+            data = await state.get_data()
+            links = data.get("links", [])
+            selected_links = [links[idx] for idx in data.get("selected", [])]
+            forward_from = data.get("forward_from", [])
+            category = data.get("category")
+            priority = int(priority)
+
+            await message.answer('Мы передали ссылку на проверку, пожалуйста, подождите.',reply_markup=ReplyKeyboardRemove())
+
+            saved, skipped, failed = await usermodel.add_links(message.from_user, selected_links, category, linkmodel, forward_from, priority=priority)
+
+            if saved and not skipped and not failed:
+                text = f"Выбранные ссылки успешно сохранены в категорию '{category}' с приоритетом {priority}."
+            else:
+                lines = []
+                if saved:
+                    lines.append(f"Сохранено ссылок: {len(saved)} из {len(selected_links)} в категорию '{category}' с приоритетом {priority}.")
+                if skipped:
+                    lines.append('Уже были сохранены ранее:\n' + '\n'.join(html.escape(link) for link in skipped))
+                if failed:
+                    lines.append('Не удалось сохранить:\n' + '\n'.join(html.escape(link) for link in failed))
+                text = '\n\n'.join(lines)
+            await message.answer(text, reply_markup=ReplyKeyboardRemove())
 
-        await state.clear()
-        await usermodel.update_waiting(user_id)
+            await state.clear()
 
     except Exception as e:
         logger.error(f'error653672: {e}')
 
 
-async def handle_get_links(message: types.Message, state: FSMContext, dispatcher):
+async def handle_get_links(message: types.Message, state: FSMContext, usermodel: Users):
     userid = message.from_user.id
-    usermodel = dispatcher['usermodel']
-
-    is_waiting = await usermodel.is_waiting(userid)
-    if is_waiting:
-        await message.answer('Пожалуйста, дождитесь ответа на предыдущий запрос.')
-        return
 
     try:
         categories = await usermodel.get_user_categories(userid)
@@ -275,47 +278,143 @@ async def handle_get_links(message: types.Message, state: FSMContext, dispatcher
         logger.error(f'error215853: {e}')
 
 
-async def handle_get_category(message: types.Message, state: FSMContext, dispatcher):
+async def handle_get_category(message: types.Message, state: FSMContext, usermodel: Users):
     userid = message.from_user.id
-    usermodel = dispatcher['usermodel']
-
-    is_waiting = await usermodel.is_waiting(userid)
-    if is_waiting:
-        await message.answer('Пожалуйста, дождитесь ответа на предыдущий запрос.')
-        return
 
     try:
         category = message.text
-        links = await usermodel.get_user_links_with_info(userid, category)
-        if links:
-            links_count = len(links)
-            links_text = f"Общее количество ссылок: {links_count}\n\n"
-            links_text += "\n\n".join([
-                f"{idx + 1}. "
-                f"{f'({", ".join(filter(None, [link.get("fullname", ""), link.get("username", ""), link.get("type", "")]))})' if any([link.get('fullname'), link.get('username'), link.get('type')]) else '(Вы)'}\n"
-                f"{link['link']}"
-                for idx, link in enumerate(links)
-                if any([link.get('fullname'), link.get('username'), link.get('type')]) or link.get('link')
-            ])
-        else:
-            links_text = "Нет доступных ссылок в этой категории."
+        links_count = await usermodel.count_user_links(userid, category)
+        if not links_count:
+            await message.answer("Нет доступных ссылок в этой категории.", reply_markup=ReplyKeyboardRemove())
+            await state.clear()
+            return
 
-        await message.answer(links_text, reply_markup=ReplyKeyboardRemove())
+        await message.answer(f"Общее количество ссылок: {links_count}", reply_markup=ReplyKeyboardRemove())
+        links, has_prev, has_next = await usermodel.get_user_links_page(userid, category, limit=config.LINKS_PAGE_SIZE)
+        await message.answer(
+            format_links_page(links, 0),
+            reply_markup=get_links_page_keyboard(category, 0, links[0]['userlinkid'], links[-1]['userlinkid'], has_prev, has_next)
+        )
         await state.clear()
     except Exception as e:
         logger.error(f'error9427642: {e}')
 
 
+async def handle_links_page(callback: types.CallbackQuery, callback_data: LinksPage, usermodel: Users):
+    try:
+        links, has_prev, has_next = await usermodel.get_user_links_page(
+            callback.from_user.id, callback_data.category, callback_data.cursor, callback_data.backward, config.LINKS_PAGE_SIZE
+        )
+        if not links:
+            await callback.answer("Больше ссылок нет.")
+            return
+
+        page = callback_data.page
+        await callback.message.edit_text(
+            format_links_page(links, page * config.LINKS_PAGE_SIZE),
+            reply_markup=get_links_page_keyboard(callback_data.category, page, links[0]['userlinkid'], links[-1]['userlinkid'], has_prev, has_next)
+        )
+        await callback.answer()
+    except Exception as e:
+        logger.error(f'error9427643: {e}')
+
 
-async def handle_refresh(message: types.Message, state: FSMContext, dispatcher):
+def format_links_page(links, start):
+    return "\n\n".join([
+        f"{start + idx + 1}. "
+        f"{f'({", ".join(filter(None, [link.get("fullname", ""), link.get("username", ""), link.get("type", "")]))})' if any([link.get('fullname'), link.get('username'), link.get('type')]) else '(Вы)'}\n"
+        f"{link['link']}"
+        for idx, link in enumerate(links)
+        if any([link.get('fullname'), link.get('username'), link.get('type')]) or link.get('link')
+    ])
+
+
+async def handle_search(message: types.Message, state: FSMContext, command: CommandObject, usermodel: Users):
+    try:
+        text = (command.args or '').strip()
+        if not text:
+            await message.answer('Напишите слова для поиска, например: /search python asyncio')
+            return
+
+        links, has_next = await usermodel.search_links(message.from_user.id, text, 0, config.LINKS_PAGE_SIZE)
+        if not links:
+            await message.answer('По вашему запросу ничего не найдено.')
+            return
+
+        await state.update_data(search_query=text)
+        await message.answer(format_search_page(links, 0), reply_markup=get_search_page_keyboard(0, config.LINKS_PAGE_SIZE, has_next))
+    except Exception as e:
+        logger.error(f'error6120935: {e}')
+
+
+async def handle_search_page(callback: types.CallbackQuery, callback_data: SearchPage, state: FSMContext, usermodel: Users):
+    try:
+        data = await state.get_data()
+        text = data.get('search_query')
+        if not text:
+            await callback.answer('Поиск устарел, повторите /search.')
+            return
+
+        offset = callback_data.offset
+        links, has_next = await usermodel.search_links(callback.from_user.id, text, offset, config.LINKS_PAGE_SIZE)
+        if not links:
+            await callback.answer('Больше ничего не найдено.')
+            return
+
+        await callback.message.edit_text(
+            format_search_page(links, offset),
+            reply_markup=get_search_page_keyboard(offset, config.LINKS_PAGE_SIZE, has_next)
+        )
+        await callback.answer()
+    except Exception as e:
+        logger.error(f'error6120936: {e}')
+
+
+def format_search_page(links, start):
+    return "\n\n".join(
+        f"{start + idx + 1}. <b>{html.escape(link['title'] or 'Без названия')}</b>\n{html.escape(link['link'])}"
+        for idx, link in enumerate(links)
+    )
+
+
+async def handle_export(message: types.Message, command: CommandObject, usermodel: Users, busy: UserBusyLock):
     userid = message.from_user.id
-    usermodel = dispatcher['usermodel']
+    path = None
+
+    try:
+        fmt, category = parse_export_args(command.args)
+        fd, path = tempfile.mkstemp(prefix='export-', suffix=EXPORT_FORMATS[fmt])
+        os.close(fd)
+
+        async with busy.hold(userid) as acquired:
+            if not acquired:
+                await message.answer(BUSY_MESSAGE)
+                return
+            count = await write_export(usermodel.stream_user_links(userid, category), path, fmt)
+            if not count:
+                await message.answer('Нет ссылок для экспорта.')
+                return
+            filename = f"links-{'all' if category == 'все' else category}{EXPORT_FORMATS[fmt]}"
+            await message.answer_document(FSInputFile(path, filename=filename), caption=f'Экспортировано ссылок: {count}')
+    except Exception as e:
+        logger.error(f'error5190371: {e}')
+        await message.answer('Не удалось выгрузить ссылки. Попробуйте позже.')
+    finally:
+        if path:
+            os.remove(path)
+
+
+def parse_export_args(args):
+    args = (args or '').strip()
+    fmt = 'csv'
+    parts = args.split(maxsplit=1)
+    if parts and parts[0].lower() in EXPORT_FORMATS:
+        fmt = parts[0].lower()
+        args = parts[1].strip() if len(parts) > 1 else ''
+    return fmt, args or 'все'
 
-    is_waiting = await usermodel.is_waiting(userid)
-    if is_waiting:
-        await message.answer('Пожалуйста, дождитесь ответа на предыдущий запрос.')
-        return
 
+async def handle_refresh(message: types.Message, state: FSMContext):
     try:
         keyboard = get_yes_no_keyboard()
         await message.answer('Эта команда обновит данные между вашей локальной базой данных и Notion аккаунтом. После того как процесс запустится, его нельзя будет остановить или отменить. Вы на это согласны?',reply_markup=keyboard)
@@ -324,33 +423,108 @@ async def handle_refresh(message: types.Message, state: FSMContext, dispatcher):
         logger.error(f'error8246715524: {e}')
 
 
-async def handle_refresh2(message: types.Message, state: FSMContext, dispatcher):
+async def handle_refresh2(message: types.Message, state: FSMContext, usermodel: Users, busy: UserBusyLock):
     userid = message.from_user.id
-    usermodel = dispatcher['usermodel']
-
-    is_waiting = await usermodel.is_waiting(userid)
-    if is_waiting:
-        await message.answer('Пожалуйста, дождитесь ответа на предыдущий запрос.')
-        return
 
     if message.text == 'Нет':
         await message.answer('Команда отменена.', reply_markup=ReplyKeyboardRemove())
         return
 
-    await usermodel.update_waiting(userid)
-
     try:
-        res = await usermodel.refresh_data(message.from_user)
-        if res is None:
-            await message.answer('Нам не удалось обновить данные', reply_markup=ReplyKeyboardRemove())
-        else:
-            await message.answer('Ваши данные обновлены успешно', reply_markup=ReplyKeyboardRemove())
+        async with busy.hold(userid) as acquired:
+            if not acquired:
+                await message.answer(BUSY_MESSAGE)
+                return
+            res = await usermodel.refresh_data(message.from_user)
+            if res is None:
+                await message.answer('Нам не удалось обновить данные', reply_markup=ReplyKeyboardRemove())
+            else:
+                await message.answer(f'Ваши данные обновлены успешно.\nИзменено: {res.updated}, добавлено из Notion: {res.created}, отправлено в Notion: {res.pushed}', reply_markup=ReplyKeyboardRemove())
     except Exception as e:
         logger.error(f'error64275792: {e}')
         await message.answer('Произошла ошибка при обновлении данных. Попробуйте позже.', reply_markup=ReplyKeyboardRemove())
     finally:
-        await usermodel.update_waiting(userid)
         await state.clear()
 
-async def handle_delete(message: types.Message, state: FSMContext, dispatcher):
-    pass
+async def handle_delete(message: types.Message, state: FSMContext, command: CommandObject, usermodel: Users):
+    userid = message.from_user.id
+
+    try:
+        selection = parse_delete_args(command.args)
+        if selection is None:
+            await message.answer(
+                'Укажите, какие ссылки удалить:\n'
+                '/deletelinks 1 3 5-7 — по номерам из списка /links (все)\n'
+                '/deletelinks category название — всю категорию\n'
+                '/deletelinks priority 3 — все ссылки с важностью 3 и ниже'
+            )
+            return
+
+        if 'numbers' in selection:
+            selection = {'userlinkids': await usermodel.get_userlink_ids(userid, selection['numbers'])}
+            if not selection['userlinkids']:
+                await message.answer('Ссылки с такими номерами не найдены.')
+                return
+
+        count = await usermodel.count_links_to_delete(userid, **selection)
+        if not count:
+            await message.answer('Нет ссылок, подходящих под условие.')
+            return
+
+        await state.set_state(UserStages.delete_confirm)
+        await state.update_data(delete=selection)
+        await message.answer(f'Будет удалено ссылок: {count}. Их страницы в Notion будут архивированы. Продолжить?', reply_markup=get_yes_no_keyboard())
+    except Exception as e:
+        logger.error(f'error3308415: {e}')
+
+
+async def handle_delete2(message: types.Message, state: FSMContext, usermodel: Users, busy: UserBusyLock):
+    userid = message.from_user.id
+
+    try:
+        if message.text != 'Да':
+            await message.answer('Команда отменена.', reply_markup=ReplyKeyboardRemove())
+            return
+
+        selection = (await state.get_data()).get('delete')
+        if not selection:
+            await message.answer('Выбор устарел, повторите /deletelinks.', reply_markup=ReplyKeyboardRemove())
+            return
+
+        async with busy.hold(userid) as acquired:
+            if not acquired:
+                await message.answer(BUSY_MESSAGE)
+                return
+            deleted = await usermodel.delete_links(userid, **selection)
+        if deleted is None:
+            await message.answer('Произошла ошибка при удалении ссылок. Попробуйте позже.', reply_markup=ReplyKeyboardRemove())
+        else:
+            await message.answer(f'Удалено ссылок: {deleted}.', reply_markup=ReplyKeyboardRemove())
+    except Exception as e:
+        logger.error(f'error3308416: {e}')
+    finally:
+        await state.clear()
+
+
+def parse_delete_args(args):
+    parts = (args or '').split(maxsplit=1)
+    if not parts:
+        return None
+
+    if parts[0].lower() in ('category', 'категория'):
+        return {'category': parts[1].strip()} if len(parts) > 1 else None
+    if parts[0].lower() in ('priority', 'приоритет'):
+        if len(parts) > 1 and parts[1].strip().isdigit():
+            return {'max_priority': int(parts[1])}
+        return None
+
+    numbers = []
+    for part in re.split(r'[\s,]+', args.strip()):
+        match = re.fullmatch(r'(\d+)(?:-(\d+))?', part)
+        if not match:
+            return None
+        start, end = int(match[1]), int(match[2] or match[1])
+        if start < 1 or end < start or end - start >= 10000:
+            return None
+        numbers.extend(range(start, end + 1))
+    return {'numbers': numbers}
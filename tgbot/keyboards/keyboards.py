@@ -1,5 +1,18 @@
+from aiogram.filters.callback_data import CallbackData
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove, InlineKeyboardMarkup, InlineKeyboardButton
 
+
+class LinksPage(CallbackData, prefix='lp'):
+    category: str
+    cursor: int
+    backward: bool
+    page: int
+
+
+class SearchPage(CallbackData, prefix='sp'):
+    offset: int
+
+
 def get_add_token_keyboard():
     return ReplyKeyboardMarkup(
         keyboard=[
@@ -38,4 +51,31 @@ def get_get_links_category_keyboard(categories):
 
 def get_priority_keyboard():
     return ReplyKeyboardMarkup(
-        keyboard=[[KeyboardButton(text=str(i)) for i in range(j, j + 2)]for j in range(1, 11, 2)],resize_keyboard=True)
\ No newline at end of file
+        keyboard=[[KeyboardButton(text=str(i)) for i in range(j, j + 2)]for j in range(1, 11, 2)],resize_keyboard=True)
+
+def get_links_page_keyboard(category, page, first_id, last_id, has_prev, has_next):
+    buttons = []
+    try:
+        if has_prev:
+            buttons.append(InlineKeyboardButton(
+                text='« Назад',
+                callback_data=LinksPage(category=category, cursor=first_id, backward=True, page=page - 1).pack()
+            ))
+        if has_next:
+            buttons.append(InlineKeyboardButton(
+                text='Вперёд »',
+                callback_data=LinksPage(category=category, cursor=last_id, backward=False, page=page + 1).pack()
+            ))
+    except ValueError:
+        # callback data is capped at 64 bytes, very long category names cannot be paged
+        return None
+    return InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
+
+
+def get_search_page_keyboard(offset, limit, has_next):
+    buttons = []
+    if offset > 0:
+        buttons.append(InlineKeyboardButton(text='« Назад', callback_data=SearchPage(offset=max(offset - limit, 0)).pack()))
+    if has_next:
+        buttons.append(InlineKeyboardButton(text='Вперёд »', callback_data=SearchPage(offset=offset + limit).pack()))
+    return InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
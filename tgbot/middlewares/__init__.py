@@ -0,0 +1,19 @@
+from aiogram import Dispatcher
+
+from tgbot.data import config
+from tgbot.database.database import AsyncSessionLocal
+from tgbot.middlewares.album import AlbumMiddleware
+from tgbot.middlewares.busy import BusyMiddleware, UserBusyLock
+from tgbot.middlewares.database import DatabaseMiddleware
+from tgbot.middlewares.metrics import MetricsMiddleware
+from tgbot.middlewares.query_log import QueryLogMiddleware
+from tgbot.services.query_log import query_log
+
+
+def setup(dp: Dispatcher) -> None:
+    dp.update.outer_middleware(QueryLogMiddleware(query_log))
+    dp.update.outer_middleware(DatabaseMiddleware(AsyncSessionLocal))
+    dp.message.outer_middleware(AlbumMiddleware(config.ALBUM_LATENCY))
+    dp.message.outer_middleware(BusyMiddleware(UserBusyLock(config.BUSY_LOCK_TIMEOUT)))
+    dp.message.middleware(MetricsMiddleware())
+    dp.callback_query.middleware(MetricsMiddleware())
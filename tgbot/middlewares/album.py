@@ -0,0 +1,37 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message
+
+
+class AlbumMiddleware(BaseMiddleware):
+    def __init__(self, latency: float) -> None:
+        self.latency = latency
+        self._albums: dict[tuple[int, str], list[Message]] = {}
+
+    async def __call__(
+        self,
+        handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
+        event: Message,
+        data: Dict[str, Any],
+    ) -> Any:
+        # only photo and video albums carry links; document groups go to /import one file at a time
+        if not event.media_group_id or not (event.photo or event.video):
+            return await handler(event, data)
+
+        key = (event.chat.id, event.media_group_id)
+        album = self._albums.get(key)
+        if album is not None:
+            album.append(event)
+            return
+
+        # the first part waits for the rest of the group and handles all of them at once
+        self._albums[key] = album = [event]
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            del self._albums[key]
+        album.sort(key=lambda message: message.message_id)
+        data['album'] = album
+        return await handler(album[0], data)
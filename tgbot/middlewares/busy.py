@@ -0,0 +1,61 @@
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message
+
+BUSY_MESSAGE = 'Пожалуйста, дождитесь ответа на предыдущий запрос.'
+
+
+class UserBusyLock:
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self._holders: dict[int, tuple[float, object]] = {}
+
+    def is_busy(self, userid: int) -> bool:
+        holder = self._holders.get(userid)
+        if holder is None:
+            return False
+        if time.monotonic() - holder[0] > self.timeout:
+            del self._holders[userid]
+            return False
+        return True
+
+    def acquire(self, userid: int) -> object | None:
+        if self.is_busy(userid):
+            return None
+        token = object()
+        self._holders[userid] = (time.monotonic(), token)
+        return token
+
+    def release(self, userid: int, token: object) -> None:
+        holder = self._holders.get(userid)
+        if holder is not None and holder[1] is token:
+            del self._holders[userid]
+
+    @asynccontextmanager
+    async def hold(self, userid: int):
+        token = self.acquire(userid)
+        try:
+            yield token is not None
+        finally:
+            if token is not None:
+                self.release(userid, token)
+
+
+class BusyMiddleware(BaseMiddleware):
+    def __init__(self, busy: UserBusyLock) -> None:
+        self.busy = busy
+
+    async def __call__(
+        self,
+        handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
+        event: Message,
+        data: Dict[str, Any],
+    ) -> Any:
+        data['busy'] = self.busy
+        if event.from_user and self.busy.is_busy(event.from_user.id):
+            await event.answer(BUSY_MESSAGE)
+            return
+        return await handler(event, data)
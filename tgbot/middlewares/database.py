@@ -0,0 +1,27 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from tgbot.models.models import Users, Tokens, Links
+
+
+class DatabaseMiddleware(BaseMiddleware):
+    def __init__(self, session_pool: sessionmaker) -> None:
+        self.session_pool = session_pool
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        async with self.session_pool() as session:
+            session: AsyncSession
+            data['session'] = session
+            data['usermodel'] = Users(session)
+            data['tokenmodel'] = Tokens(session)
+            data['linkmodel'] = Links(session)
+            return await handler(event, data)
@@ -0,0 +1,24 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+
+from tgbot.services.query_log import QueryLog
+
+
+class QueryLogMiddleware(BaseMiddleware):
+    def __init__(self, query_log: QueryLog) -> None:
+        self.query_log = query_log
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        stats, token = self.query_log.begin()
+        try:
+            return await handler(event, data)
+        finally:
+            user = data.get('event_from_user')
+            self.query_log.finish(stats, token, event.update_id, user.id if user else None)
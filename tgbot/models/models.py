@@ -1,15 +1,19 @@
 import asyncio
 import datetime
 import logging
-from notion_client import Client
 import tldextract
 import betterlogging as bl
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import insert, delete, exists, func, or_, literal_column, table
 from sqlalchemy.future import select
-from tgbot.database.database import User, UserLink, Link, ForwardFrom
-from bs4 import BeautifulSoup
-import aiohttp
-import json
+from tgbot.database.database import User, UserLink, Link, ForwardFrom, NotionOutbox, dialect_insert, upsert_links, LINK_SEARCH_VECTOR, CATEGORY_SEARCH_VECTOR
+from tgbot.services.notion import notion_pool
+from tgbot.services.notion_queue import notion_outbox
+from tgbot.services.notion_sync import NotionSync
+from tgbot.services.metadata import metadata_fetcher, metadata_cache
+from tgbot.services.urls import url_hash
+from tgbot.services.cache import category_cache
+from tgbot.data import config
 log_level = logging.INFO
 bl.basic_colorized_config(level=log_level)
 logger = logging.getLogger(__name__)
@@ -42,122 +46,295 @@ class Users:
         except Exception as e:
             logger.error(f'error73567652: {e}')
 
-    async def is_waiting(self, userid):
-        try:
-            result = await self.session.execute(select(User.waiting).filter(User.userid == userid))
-            return result.scalar_one_or_none()
-        except Exception as e:
-            logger.error(f'error42685682: {e}')
-
-    async def update_waiting(self, userid):
-        try:
-            status_now = await self.is_waiting(userid)
-            new_status = not status_now
-            user = await self.session.execute(select(User).filter(User.userid == userid))
-            user = user.scalar_one_or_none()
-            if user:
-                user.waiting = new_status
-                await self.session.commit()
-        except Exception as e:
-            logger.error(f'error2642462: {e}')
-
     async def get_user_categories(self, userid: int):
+        cached = category_cache.get(userid)
+        if cached is not None:
+            return list(cached)
         try:
-            result = await self.session.execute(select(UserLink.category).filter(UserLink.userid == userid))
-            categories = result.fetchall()
-            if categories:
-                category_list = list({category.category for category in categories})
-                return category_list
-            return ['other']
+            result = await self.session.execute(
+                select(UserLink.category).filter(UserLink.userid == userid).distinct().order_by(UserLink.category)
+            )
+            categories = [row.category for row in result if row.category] or ['other']
+            category_cache.put(userid, tuple(categories))
+            return categories
         except Exception as e:
             logger.error(f'error2463467: {e}')
             return ['other']
 
-    async def add_link(self, user, link: str, category: str, dispatcher, forward_from, priority):
-        linkmodel = dispatcher['linkmodel']
+    async def add_links(self, user, links: list[str], category: str, linkmodel, forward_from, priority):
+        # returns (saved, already saved by this user, failed)
+        hashes = {}
+        failed = []
+        for link in links:
+            try:
+                hashes.setdefault(url_hash(link), link)
+            except ValueError:
+                failed.append(link)
+        if not hashes:
+            return [], [], failed
+
         try:
-            extracted = tldextract.extract(link)
-            domain = extracted.domain + '.' + extracted.suffix if extracted.domain and extracted.suffix else None
-            if domain:
-                domain = domain.split('.')[0]
-            metadata = await linkmodel.fetch_metadata(link)
-
-            meta_title = metadata.get('title', 'Без названия')
-            meta_category = metadata.get('category', 'other')
-            meta_source = metadata.get('source', domain)
-            existing_link = await self.session.execute(select(Link).where(Link.link == link))
-            existing_link = existing_link.scalar()
-
-            if existing_link is not None:
-                return False, link
-
-            new_link = Link(link=link, source=meta_source, added_at=datetime.datetime.now(), title= meta_title, category = meta_category)
-            self.session.add(new_link)
-            await self.session.commit()
+            metadata = await linkmodel.fetch_metadata_many(list(hashes.values()))
 
-            linkid = new_link.linkid
-            print('categoryyyyyyyy')
-            print(category)
-            user_link = UserLink(userid=user.id, linkid=linkid, category=category, priority= priority)
-            self.session.add(user_link)
-            await self.session.commit()
+            token = await self.session.execute(
+                dialect_insert(self.session, User)
+                .values(userid=user.id, fullname=user.full_name, username=user.username or 'Пусто')
+                .on_conflict_do_update(index_elements=[User.userid], set_={'fullname': user.full_name})
+                .returning(User.token)
+            )
+            token = token.scalar()
+
+            link_rows = []
+            for link_hash, link in hashes.items():
+                meta = metadata.get(link) or {}
+                link_rows.append({
+                    'link': link,
+                    'url_hash': link_hash,
+                    'title': meta.get('title', 'Без названия'),
+                    'category': meta.get('category', 'other'),
+                    'source': meta.get('source', self._domain(link)),
+                })
+            linkids = {linkid: hashes[link_hash] for link_hash, linkid in (await upsert_links(self.session, link_rows)).items()}
+
+            result = await self.session.execute(
+                dialect_insert(self.session, UserLink)
+                .on_conflict_do_nothing(index_elements=[UserLink.userid, UserLink.linkid])
+                .returning(UserLink.userlinkid, UserLink.linkid),
+                [{
+                    'userid': user.id,
+                    'linkid': linkid,
+                    'category': category,
+                    'priority': priority,
+                    'notion_status': 'pending' if token else None,
+                } for linkid in linkids],
+            )
+            user_links = {row.userlinkid: linkids[row.linkid] for row in result}
 
-            if forward_from:
-                forward_info = ForwardFrom(
-                    username=forward_from[0] or 'Отсутствует',
-                    fullname=forward_from[1],
-                    type=forward_from[2],
-                    userlinkid=user_link.userlinkid
-                )
-                self.session.add(forward_info)
-                await self.session.commit()
+            if user_links and forward_from:
+                await self.session.execute(insert(ForwardFrom), [{
+                    'userlinkid': userlinkid,
+                    'username': forward_from[0] or 'Отсутствует',
+                    'fullname': forward_from[1],
+                    'type': forward_from[2],
+                } for userlinkid in user_links])
 
-            token = await self.check_token_db(user)
-            if token is None:
-                return
-            tokenmodel = dispatcher['tokenmodel']
-            await tokenmodel.add_link_to_notion(user.id, link, category, meta_source, meta_title, priority)
+            if user_links and token:
+                await self.session.execute(insert(NotionOutbox), [
+                    {'userlinkid': userlinkid, 'userid': user.id} for userlinkid in user_links
+                ])
 
-            return True
+            await self.session.commit()
+            if user_links:
+                category_cache.invalidate(user.id)
+            if user_links and token:
+                notion_outbox.wake()
+
+            saved = list(user_links.values())
+            stored = set(linkids.values())
+            skipped = [link for link in hashes.values() if link in stored and link not in saved]
+            return saved, skipped, failed + [link for link in hashes.values() if link not in stored]
         except Exception as e:
+            await self.session.rollback()
             logger.error(f"error325323677: {e}")
-            return False, link
+            return [], [], links
+
+    @staticmethod
+    def _domain(link: str):
+        extracted = tldextract.extract(link)
+        return extracted.domain or None
+
+    def _user_links_query(self, userid, category):
+        query = (
+            select(UserLink.userlinkid, Link.title, Link.link, ForwardFrom.username, ForwardFrom.fullname, ForwardFrom.type)
+            .select_from(UserLink)
+            .join(Link, Link.linkid == UserLink.linkid)
+            .outerjoin(ForwardFrom, ForwardFrom.userlinkid == UserLink.userlinkid)
+            .filter(UserLink.userid == userid)
+        )
+        if category != 'все':
+            query = query.filter(UserLink.category == category)
+        return query
+
+    @staticmethod
+    def _link_info(row) -> dict:
+        return {
+            'userlinkid': row.userlinkid,
+            'title': row.title,
+            'link': row.link,
+            'username': row.username,
+            'fullname': row.fullname,
+            'type': row.type
+        }
+
+    async def get_user_links_page(self, userid, category, cursor=None, backward=False, limit=10):
+        try:
+            query = self._user_links_query(userid, category)
+            if cursor is not None:
+                query = query.filter(UserLink.userlinkid < cursor if backward else UserLink.userlinkid > cursor)
+            query = query.order_by(UserLink.userlinkid.desc() if backward else UserLink.userlinkid).limit(limit + 1)
+            rows = (await self.session.execute(query)).fetchall()
+
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+            if backward:
+                rows.reverse()
+                return [self._link_info(row) for row in rows], has_more, True
+            return [self._link_info(row) for row in rows], cursor is not None, has_more
+        except Exception as e:
+            logger.error(f'error03562457: {e}')
+            return [], False, False
 
-    async def get_user_links_with_info(self, userid, category):
+    async def count_user_links(self, userid, category) -> int:
         try:
-            query = select(UserLink, Link).join(Link, Link.linkid == UserLink.linkid).filter(UserLink.userid == userid)
+            query = select(func.count()).select_from(UserLink).filter(UserLink.userid == userid)
             if category != 'все':
                 query = query.filter(UserLink.category == category)
-            user_links = await self.session.execute(query)
-            user_links = user_links.fetchall()
-
-            if not user_links:
-                return []
-
-            link_data = []
-            for user_link, link in user_links:
-                user_info = await self.session.execute(select(ForwardFrom).filter(ForwardFrom.userlinkid == user_link.userlinkid))
-                user_info = user_info.scalar_one_or_none()
-
-                link_data.append({
-                    'title': link.title,
-                    'link': link.link,
-                    'username': user_info.username if user_info else None,
-                    'fullname': user_info.fullname if user_info else None,
-                    'type': user_info.type if user_info else None
-                })
-            return link_data
+            return (await self.session.execute(query)).scalar()
+        except Exception as e:
+            logger.error(f'error03562458: {e}')
+            return 0
+
+    async def search_links(self, userid, text: str, offset=0, limit=10):
+        try:
+            if self.session.bind.dialect.name == 'sqlite':
+                query = self._sqlite_search_query(userid, text)
+            else:
+                query = self._postgresql_search_query(userid, text)
+            rows = (await self.session.execute(query.offset(offset).limit(limit + 1))).fetchall()
+            return [self._link_info(row) for row in rows[:limit]], len(rows) > limit
+        except Exception as e:
+            logger.error(f'error6120934: {e}')
+            return [], False
+
+    def _postgresql_search_query(self, userid, text: str):
+        tsquery = func.websearch_to_tsquery(literal_column("'simple'"), text)
+        link_vector = literal_column(LINK_SEARCH_VECTOR)
+        category_vector = literal_column(CATEGORY_SEARCH_VECTOR)
+        rank = func.ts_rank(link_vector, tsquery) + func.ts_rank(category_vector, tsquery)
+        return (
+            self._user_links_query(userid, 'все')
+            .filter(or_(link_vector.op('@@')(tsquery), category_vector.op('@@')(tsquery)))
+            .order_by(rank.desc(), UserLink.userlinkid.desc())
+        )
+
+    def _sqlite_search_query(self, userid, text: str):
+        match = ' '.join('"' + word.replace('"', '""') + '"*' for word in text.split())
+        link_fts = (
+            select(literal_column('rowid').label('linkid'), literal_column('rank').label('rank'))
+            .select_from(table('links_fts'))
+            .where(literal_column('links_fts').op('MATCH')(match))
+            .subquery()
+        )
+        category_fts = (
+            select(literal_column('rowid').label('userlinkid'), literal_column('rank').label('rank'))
+            .select_from(table('userlinks_fts'))
+            .where(literal_column('userlinks_fts').op('MATCH')(match))
+            .subquery()
+        )
+        # fts5 rank is negative, lower is a better match
+        rank = func.coalesce(link_fts.c.rank, 0) + func.coalesce(category_fts.c.rank, 0)
+        return (
+            self._user_links_query(userid, 'все')
+            .outerjoin(link_fts, link_fts.c.linkid == Link.linkid)
+            .outerjoin(category_fts, category_fts.c.userlinkid == UserLink.userlinkid)
+            .filter(or_(link_fts.c.linkid.isnot(None), category_fts.c.userlinkid.isnot(None)))
+            .order_by(rank, UserLink.userlinkid.desc())
+        )
+
+    async def stream_user_links(self, userid, category):
+        query = (
+            select(
+                Link.link, Link.title, UserLink.category, Link.source, UserLink.priority, Link.added_at,
+                ForwardFrom.username.label('forward_username'),
+                ForwardFrom.fullname.label('forward_fullname'),
+                ForwardFrom.type.label('forward_type'),
+            )
+            .select_from(UserLink)
+            .join(Link, Link.linkid == UserLink.linkid)
+            .outerjoin(ForwardFrom, ForwardFrom.userlinkid == UserLink.userlinkid)
+            .filter(UserLink.userid == userid)
+            .order_by(UserLink.userlinkid)
+            .execution_options(yield_per=config.EXPORT_YIELD_PER)
+        )
+        if category != 'все':
+            query = query.filter(UserLink.category == category)
+        result = await self.session.stream(query)
+        async for row in result:
+            yield row
+
+    async def get_userlink_ids(self, userid, numbers: list[int]) -> list[int]:
+        try:
+            rows = await self.session.execute(
+                select(UserLink.userlinkid).filter(UserLink.userid == userid).order_by(UserLink.userlinkid).limit(max(numbers))
+            )
+            userlinkids = rows.scalars().all()
+            return [userlinkids[number - 1] for number in sorted(set(numbers)) if number <= len(userlinkids)]
         except Exception as e:
-            logger.error(f'error03562456: {e}')
+            logger.error(f'error4410921: {e}')
             return []
 
+    @staticmethod
+    def _delete_conditions(userid, userlinkids=None, category=None, max_priority=None):
+        conditions = [UserLink.userid == userid]
+        if userlinkids is not None:
+            conditions.append(UserLink.userlinkid.in_(userlinkids))
+        if category is not None:
+            conditions.append(UserLink.category == category)
+        if max_priority is not None:
+            conditions.append(UserLink.priority <= max_priority)
+        return conditions
+
+    async def count_links_to_delete(self, userid, userlinkids=None, category=None, max_priority=None) -> int:
+        try:
+            conditions = self._delete_conditions(userid, userlinkids, category, max_priority)
+            return (await self.session.execute(select(func.count()).select_from(UserLink).where(*conditions))).scalar()
+        except Exception as e:
+            logger.error(f'error4410922: {e}')
+            return 0
+
+    async def delete_links(self, userid, userlinkids=None, category=None, max_priority=None) -> int:
+        try:
+            conditions = self._delete_conditions(userid, userlinkids, category, max_priority)
+            selected = select(UserLink.userlinkid).where(*conditions)
+            await self.session.execute(delete(ForwardFrom).where(ForwardFrom.userlinkid.in_(selected)))
+            await self.session.execute(delete(NotionOutbox).where(NotionOutbox.userlinkid.in_(selected)))
+            deleted = (await self.session.execute(
+                delete(UserLink).where(*conditions).returning(UserLink.linkid, UserLink.notion_page_id)
+            )).all()
+            if not deleted:
+                await self.session.rollback()
+                return 0
+
+            linkids = {row.linkid for row in deleted}
+            await self.session.execute(
+                delete(Link).where(Link.linkid.in_(linkids), ~exists().where(UserLink.linkid == Link.linkid))
+            )
+
+            archive = [
+                {'userlinkid': None, 'userid': userid, 'action': 'archive', 'notion_page_id': row.notion_page_id}
+                for row in deleted if row.notion_page_id
+            ]
+            if archive:
+                await self.session.execute(insert(NotionOutbox), archive)
+
+            await self.session.commit()
+            category_cache.invalidate(userid)
+            if archive:
+                notion_outbox.wake()
+            return len(deleted)
+        except Exception as e:
+            await self.session.rollback()
+            logger.error(f'error4410923: {e}')
+            return None
+
     async def refresh_data(self, user):
         token = await self.check_token_db(user)
         if token is None:
             return
         try:
-            pass
+            return await NotionSync(self.session).run(user.id)
         except Exception as e:
+            await self.session.rollback()
             logger.error(f'error7285662: {e}')
 
 class Tokens:
@@ -166,24 +343,20 @@ class Tokens:
 
     async def check_notion_token(self, token: str) -> bool:
         try:
-            notion_result = await asyncio.to_thread(self._check_notion_token_sync, token)
-            return notion_result
+            await notion_pool.get(token).users.me()
+            return True
         except Exception as e:
+            notion_pool.discard(token)
             logger.error(f"error9249482: {e}")
             return False
 
-    def _check_notion_token_sync(self, token: str):
-        notion = Client(auth=token)
-        user_info = notion.users.me()
-        return True
-
     async def add_token(self, userid: int, token: str) -> bool:
         is_token_valid = await self.check_notion_token(token)
         if not is_token_valid:
             return False
 
         try:
-            notion = Client(auth=token)
+            notion = notion_pool.get(token)
             database_id = await self.get_or_create_notion_db(notion)
             if database_id is None:
                 return False
@@ -206,67 +379,10 @@ class Tokens:
         except Exception as e:
             logger.error(f"error8248512: {e}")
 
-    async def add_link_to_notion(self, userid, link, category, source, title, priority):
-        try:
-
-            token = await self.get_user_token(userid)
-            if not token:
-                logger.error(f"User {userid} does not have a valid Notion token.")
-                return
-
-            notion = Client(auth=token)
-
-            database_id = await self._get_database_id_from_db(userid)
-            if not database_id:
-                logger.error(f"User {userid} does not have a valid Notion database ID.")
-                return
-            print(22222222222222)
-            notion.pages.create(
-                parent={"database_id": database_id},
-                properties={
-                    "title": {"title": [{"text": {"content": title if title else ""}}]},
-                    "link": {"url": link if link else ""},
-                    "category": {"rich_text": [{"text": {"content": category if category else ""}}]},
-                    "source": {"rich_text": [{"text": {"content": source if source else ""}}]},
-                    "priority": {"number": priority if priority is not None else 0}
-                }
-            )
-
-        except Exception as e:
-            logger.error(f"error2567891911: {e}")
-
-    async def _get_database_id_from_db(self, userid):
-        try:
-            result = await self.session.execute(select(User.notion_db_id).filter(User.userid == userid))
-            return result.scalar_one_or_none()
-        except Exception as e:
-            logger.error(f"Error retrieving database ID from DB: {e}")
-            return None
-
-    async def get_user_token(self, userid: int) -> str:
-        try:
-            token = await self._get_user_token_from_db(userid)
-            if token:
-                return token
-            else:
-                raise ValueError("No token found for user")
-        except Exception as e:
-            logger.error(f"error85858582: {e}")
-            return None
-
-    async def _get_user_token_from_db(self, userid):
-        try:
-            result = await self.session.execute(select(User.token).filter(User.userid == userid))
-            token = result.scalar_one_or_none()
-            return token
-        except Exception as e:
-            logger.error(f"error3287462: {e}")
-            return None
-
     async def create_and_get_page_id(self, notion) -> str:
         try:
 
-            pages = await asyncio.to_thread(notion.search, filter={"property": "object", "value": "page"})
+            pages = await notion.search(filter={"property": "object", "value": "page"})
 
             for pg in pages.get('results', []):
                 properties = pg.get('properties', {})
@@ -282,7 +398,7 @@ class Tokens:
 
 
     async def get_or_create_notion_db(self, notion) -> str:
-        databases = await asyncio.to_thread(notion.search, filter={"property": "object", "value": "database"})
+        databases = await notion.search(filter={"property": "object", "value": "database"})
         database_id = None
 
         for db in databases['results']:
@@ -296,7 +412,7 @@ class Tokens:
             if page_id is None:
                 return None
 
-            new_database = await asyncio.to_thread(notion.databases.create,
+            new_database = await notion.databases.create(
             parent={"page_id": page_id},
             title=[{"type": "text", "text": {"content": "linksinbot"}}],
             properties={
@@ -314,49 +430,21 @@ class Links:
     def __init__(self, session: AsyncSession):
         self.session = session
 
-    async def fetch_metadata(self, url: str) -> dict:
+    async def fetch_metadata_many(self, urls: list[str]) -> dict:
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url) as response:
-                    html = await response.text()
-
-            soup = BeautifulSoup(html, 'html.parser')
-
-            title = soup.title.string if soup.title else 'Неизвестно'
-            category = None
-            source = url
-
-            for meta in soup.find_all('meta'):
-                if meta.get('property', '').lower() == 'og:title':
-                    title = meta.get('content', title)
-
-                if meta.get('property', '').lower() == 'og:type':
-                    category = meta.get('content', category)
-
-                if meta.get('name', '').lower() == 'twitter:title':
-                    title = meta.get('content', title)
-
-                if meta.get('name', '').lower() == 'category':
-                    category = meta.get('content', category)
-
-                if meta.get('name', '').lower() == 'source':
-                    source = meta.get('content', source)
-
-            script_tags = soup.find_all('script', type='application/ld+json')
-            for script in script_tags:
-                try:
-                    json_data = json.loads(script.string)
-                    if isinstance(json_data, dict) and 'category' in json_data:
-                        category = json_data.get('category', category)
-                except Exception as e:
-                    logger.error(f"Ошибка при обработке JSON-LD: {e}")
-
-            return {
-                'title': title,
-                'category': category,
-                'source': source
-            }
-
+            stored = await self._stored_metadata(urls)
+            for url, metadata in stored.items():
+                metadata_cache.put(url, metadata)
+            missing = [url for url in urls if url not in stored]
+            fetched = await asyncio.gather(*(metadata_cache.get(url, metadata_fetcher.fetch) for url in missing))
+            return {**stored, **dict(zip(missing, fetched))}
         except Exception as e:
-            logger.error(f"Ошибка при получении мета-данных: {e}")
+            logger.error(f'error8135208: {e}')
             return {}
+
+    async def _stored_metadata(self, urls: list[str]) -> dict:
+        hashes = {url_hash(url): url for url in urls}
+        result = await self.session.execute(
+            select(Link.url_hash, Link.title, Link.category, Link.source).where(Link.url_hash.in_(hashes))
+        )
+        return {hashes[row.url_hash]: {'title': row.title, 'category': row.category, 'source': row.source} for row in result}
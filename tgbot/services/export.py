@@ -0,0 +1,33 @@
+import csv
+from typing import AsyncIterator
+
+import orjson
+
+EXPORT_FIELDS = ['link', 'title', 'category', 'source', 'priority', 'forward_username', 'forward_fullname', 'forward_type', 'added_at']
+EXPORT_FORMATS = {'csv': '.csv', 'json': '.jsonl', 'jsonl': '.jsonl'}
+
+
+def _record(row) -> dict:
+    record = {field: getattr(row, field) for field in EXPORT_FIELDS}
+    if record['added_at'] is not None:
+        record['added_at'] = record['added_at'].isoformat()
+    return record
+
+
+async def write_export(rows: AsyncIterator, path: str, fmt: str) -> int:
+    count = 0
+    if fmt == 'csv':
+        # utf-8-sig so that Excel opens Cyrillic titles correctly
+        with open(path, 'w', encoding='utf-8-sig', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=EXPORT_FIELDS)
+            writer.writeheader()
+            async for row in rows:
+                writer.writerow(_record(row))
+                count += 1
+        return count
+
+    with open(path, 'wb') as file:
+        async for row in rows:
+            file.write(orjson.dumps(_record(row)) + b'\n')
+            count += 1
+    return count
@@ -0,0 +1,322 @@
+import asyncio
+import contextlib
+import logging
+import os
+import re
+from dataclasses import dataclass
+from html.parser import HTMLParser
+from typing import Iterator
+
+import tldextract
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from sqlalchemy import insert, update
+from sqlalchemy.future import select
+from sqlalchemy.orm import sessionmaker
+
+from tgbot.data import config
+from tgbot.database.database import AsyncSessionLocal, User, Link, UserLink, NotionOutbox, dialect_insert, upsert_links
+from tgbot.services.cache import category_cache
+from tgbot.services.metadata import metadata_fetcher, metadata_cache
+from tgbot.services.notion_queue import notion_outbox
+from tgbot.services.urls import url_hash, is_valid_link
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+LINK_PATTERN = re.compile(r'(?:https?://|www\.)[^\s<>"\'\\]+')
+TRAILING_PUNCTUATION = '.,;:!?)]}'
+
+
+def import_kind(file_name: str | None, mime_type: str | None) -> str | None:
+    name = (file_name or '').lower()
+    if name.endswith(('.html', '.htm')) or mime_type == 'text/html':
+        return 'bookmarks'
+    if name.endswith('.json') or mime_type == 'application/json':
+        return 'telegram'
+    if name.endswith(('.txt', '.csv', '.md')) or (mime_type or '').startswith('text/'):
+        return 'text'
+    return None
+
+
+class _BookmarkParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.items: list[tuple[str, str | None, str | None]] = []
+        self._folders: list[str | None] = []
+        self._next_folder = None
+        self._href = None
+        self._capture = None
+        self._buffer = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'a':
+            href = dict(attrs).get('href') or ''
+            if href.startswith(('http://', 'https://')):
+                self._href = href
+                self._capture = 'a'
+                self._buffer = []
+        elif tag == 'h3':
+            self._capture = 'h3'
+            self._buffer = []
+        elif tag == 'dl':
+            self._folders.append(self._next_folder)
+            self._next_folder = None
+
+    def handle_endtag(self, tag):
+        if tag == 'a' and self._capture == 'a':
+            title = ''.join(self._buffer).strip()
+            folder = next((folder for folder in reversed(self._folders) if folder), None)
+            self.items.append((self._href, title or None, folder))
+            self._href = self._capture = None
+        elif tag == 'h3' and self._capture == 'h3':
+            self._next_folder = ''.join(self._buffer).strip() or None
+            self._capture = None
+        elif tag == 'dl' and self._folders:
+            self._folders.pop()
+
+    def handle_data(self, data):
+        if self._capture:
+            self._buffer.append(data)
+
+
+def _iter_bookmarks(file) -> Iterator[tuple[str, str | None, str | None]]:
+    parser = _BookmarkParser()
+    while chunk := file.read(CHUNK_SIZE):
+        parser.feed(chunk)
+        yield from parser.items
+        parser.items.clear()
+    parser.close()
+    yield from parser.items
+
+
+def _iter_text(file, unescape_json: bool) -> Iterator[tuple[str, str | None, str | None]]:
+    tail = ''
+    while True:
+        chunk = file.read(CHUNK_SIZE)
+        text = tail + chunk
+        if chunk:
+            # a link never spans whitespace or a JSON quote, so cut there and carry the rest over
+            cut = max(text.rfind(' '), text.rfind('\n'), text.rfind('"')) + 1
+            if cut == 0 and len(text) > 2 * CHUNK_SIZE:
+                cut = len(text)
+            text, tail = text[:cut], text[cut:]
+        if unescape_json:
+            text = text.replace('\\/', '/')
+        for match in LINK_PATTERN.finditer(text):
+            link = match.group().rstrip(TRAILING_PUNCTUATION)
+            if '.' in link:
+                yield link, None, None
+        if not chunk:
+            return
+
+
+def iter_links(path: str, kind: str) -> Iterator[tuple[str, str | None, str | None]]:
+    with open(path, encoding='utf-8', errors='replace') as file:
+        if kind == 'bookmarks':
+            yield from _iter_bookmarks(file)
+        else:
+            yield from _iter_text(file, unescape_json=kind == 'telegram')
+
+
+@dataclass
+class ImportProgress:
+    found: int = 0
+    invalid: int = 0
+    saved: int = 0
+    processed: int = 0
+    queued: int = 0
+    done: bool = False
+
+    def text(self) -> str:
+        lines = [
+            'Импорт завершён.' if self.done else 'Идёт импорт ссылок...',
+            f'Найдено ссылок: {self.found}',
+            *([f'Пропущено некорректных: {self.invalid}'] if self.invalid else []),
+            f'Сохранено новых: {self.saved}',
+            f'Обработано: {self.processed}/{self.saved}',
+        ]
+        if self.done and self.queued:
+            lines.append('Страницы в Notion создаются в фоне.')
+        return '\n'.join(lines)
+
+
+class LinkImporter:
+    def __init__(self, session_pool: sessionmaker, batch_size: int, progress_interval: float, max_queued: int):
+        self.session_pool = session_pool
+        self.batch_size = batch_size
+        self.progress_interval = progress_interval
+        self.max_queued = max_queued
+        self._tasks: dict[int, list[asyncio.Task]] = {}
+
+    def is_running(self, userid: int) -> bool:
+        return userid in self._tasks
+
+    def is_full(self, userid: int) -> bool:
+        return len(self._tasks.get(userid, ())) >= self.max_queued
+
+    def start(self, bot: Bot, userid: int, path: str, kind: str, category: str | None, message) -> None:
+        # files of one user are imported one after another, e.g. several documents sent as one group
+        tasks = self._tasks.setdefault(userid, [])
+        task = asyncio.create_task(self._run(bot, userid, path, kind, category, message, tasks[-1] if tasks else None))
+        tasks.append(task)
+        task.add_done_callback(lambda _: self._finish(userid, task))
+
+    def _finish(self, userid: int, task: asyncio.Task) -> None:
+        tasks = self._tasks.get(userid)
+        if tasks is None:
+            return
+        tasks.remove(task)
+        if not tasks:
+            del self._tasks[userid]
+
+    async def stop(self) -> None:
+        tasks = [task for user_tasks in self._tasks.values() for task in user_tasks]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    async def _run(self, bot: Bot, userid: int, path: str, kind: str, category: str | None, message,
+                   previous: asyncio.Task | None) -> None:
+        progress = ImportProgress()
+        try:
+            if previous is not None:
+                await asyncio.wait([previous])
+            reported = asyncio.get_running_loop().time()
+            async with self.session_pool() as session:
+                token = (await session.execute(select(User.token).where(User.userid == userid))).scalar()
+
+                first = last = None
+                batch = []
+                for item in iter_links(path, kind):
+                    batch.append(item)
+                    if len(batch) < self.batch_size:
+                        continue
+                    first, last = self._span(first, last, await self._save(session, userid, batch, category, progress))
+                    batch = []
+                    reported = await self._report(bot, message, progress, reported)
+                if batch:
+                    first, last = self._span(first, last, await self._save(session, userid, batch, category, progress))
+
+                if first is not None:
+                    await self._enrich(session, bot, message, userid, token, first, last, progress)
+
+            progress.done = True
+            await self._report(bot, message, progress, None)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f'error7730142: {e}')
+            with contextlib.suppress(Exception):
+                await bot.edit_message_text(
+                    progress.text() + '\n\nИмпорт прервался из-за ошибки. Уже сохранённые ссылки останутся.',
+                    chat_id=message.chat.id, message_id=message.message_id,
+                )
+        finally:
+            with contextlib.suppress(OSError):
+                os.remove(path)
+
+    @staticmethod
+    def _span(first, last, userlinkids):
+        if not userlinkids:
+            return first, last
+        return min(userlinkids) if first is None else first, max(userlinkids)
+
+    async def _save(self, session, userid: int, batch, category: str | None, progress: ImportProgress) -> list[int]:
+        progress.found += len(batch)
+        hashes = {}
+        for link, title, folder in batch:
+            if not is_valid_link(link):
+                progress.invalid += 1
+                continue
+            hashes.setdefault(url_hash(link), (link, title, folder))
+        if not hashes:
+            return []
+
+        linkids = await upsert_links(session, [{
+            'link': link,
+            'url_hash': link_hash,
+            'title': title,
+            'source': tldextract.extract(link).domain or None,
+        } for link_hash, (link, title, folder) in hashes.items()])
+        linkids = {linkid: hashes[link_hash] for link_hash, linkid in linkids.items()}
+
+        result = await session.execute(
+            dialect_insert(session, UserLink)
+            .on_conflict_do_nothing(index_elements=[UserLink.userid, UserLink.linkid])
+            .returning(UserLink.userlinkid),
+            [{
+                'userid': userid,
+                'linkid': linkid,
+                'category': category or folder or 'import',
+            } for linkid, (link, title, folder) in linkids.items()],
+        )
+        userlinkids = result.scalars().all()
+        await session.commit()
+
+        progress.saved += len(userlinkids)
+        if userlinkids:
+            category_cache.invalidate(userid)
+        return userlinkids
+
+    async def _enrich(self, session, bot: Bot, message, userid: int, token, first: int, last: int, progress: ImportProgress) -> None:
+        reported = asyncio.get_running_loop().time()
+        cursor = first - 1
+        while True:
+            rows = (await session.execute(
+                select(UserLink.userlinkid, Link.linkid, Link.link, Link.title)
+                .join(Link, Link.linkid == UserLink.linkid)
+                .where(
+                    UserLink.userid == userid,
+                    UserLink.userlinkid > cursor,
+                    UserLink.userlinkid <= last,
+                    UserLink.notion_status.is_(None),
+                )
+                .order_by(UserLink.userlinkid)
+                .limit(self.batch_size)
+            )).all()
+            if not rows:
+                return
+            cursor = rows[-1].userlinkid
+
+            untitled = [row for row in rows if row.title is None]
+            if untitled:
+                fetched = await asyncio.gather(*(metadata_cache.get(row.link, metadata_fetcher.fetch) for row in untitled))
+                await session.execute(update(Link), [{
+                    'linkid': row.linkid,
+                    'title': metadata.get('title', 'Без названия'),
+                    **({'category': metadata['category']} if metadata.get('category') else {}),
+                } for row, metadata in zip(untitled, fetched)])
+
+            if token:
+                userlinkids = [row.userlinkid for row in rows]
+                await session.execute(insert(NotionOutbox), [{'userlinkid': userlinkid, 'userid': userid} for userlinkid in userlinkids])
+                await session.execute(update(UserLink).where(UserLink.userlinkid.in_(userlinkids)).values(notion_status='pending'))
+            await session.commit()
+            if token:
+                progress.queued += len(rows)
+                notion_outbox.wake()
+
+            progress.processed += len(rows)
+            reported = await self._report(bot, message, progress, reported)
+
+    async def _report(self, bot: Bot, message, progress: ImportProgress, reported: float | None) -> float:
+        now = asyncio.get_running_loop().time()
+        if reported is not None and now - reported < self.progress_interval:
+            return reported
+        try:
+            await bot.edit_message_text(progress.text(), chat_id=message.chat.id, message_id=message.message_id)
+        except TelegramBadRequest:
+            pass
+        except Exception as e:
+            logger.error(f'error7730143: {e}')
+        return now
+
+
+link_importer = LinkImporter(
+    AsyncSessionLocal,
+    batch_size=config.IMPORT_BATCH_SIZE,
+    progress_interval=config.IMPORT_PROGRESS_INTERVAL,
+    max_queued=config.IMPORT_MAX_QUEUED,
+)
@@ -0,0 +1,237 @@
+import asyncio
+import codecs
+import json
+import logging
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from html.parser import HTMLParser
+from typing import Awaitable, Callable
+
+import aiohttp
+import tldextract
+
+from tgbot.data import config
+from tgbot.services.metrics import metadata_duration
+from tgbot.services.urls import canonicalize_url
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 16 * 1024
+
+
+class _HeadParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = None
+        self.meta: dict[str, str] = {}
+        self.json_ld: list[str] = []
+        self.done = False
+        self._capture = None
+        self._buffer: list[str] = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'body':
+            self.done = True
+        elif tag == 'title' and self.title is None:
+            self._capture, self._buffer = 'title', []
+        elif tag == 'script':
+            attrs = dict(attrs)
+            if (attrs.get('type') or '').lower() == 'application/ld+json':
+                self._capture, self._buffer = 'json_ld', []
+        elif tag == 'meta':
+            attrs = dict(attrs)
+            key = (attrs.get('property') or attrs.get('name') or '').lower()
+            if key and attrs.get('content') is not None:
+                self.meta.setdefault(key, attrs['content'])
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        if tag == 'head':
+            self.done = True
+        elif tag == 'title' and self._capture == 'title':
+            self.title = ''.join(self._buffer).strip()
+            self._capture = None
+        elif tag == 'script' and self._capture == 'json_ld':
+            self.json_ld.append(''.join(self._buffer))
+            self._capture = None
+
+    def handle_data(self, data):
+        if self._capture:
+            self._buffer.append(data)
+
+
+def _build_metadata(parser: _HeadParser, url: str) -> dict:
+    meta = parser.meta
+    title = meta.get('og:title') or meta.get('twitter:title') or parser.title or 'Неизвестно'
+    category = meta.get('category') or meta.get('og:type')
+    source = meta.get('source', url)
+
+    for raw in parser.json_ld:
+        try:
+            json_data = json.loads(raw)
+            if isinstance(json_data, dict) and 'category' in json_data:
+                category = json_data.get('category', category)
+        except Exception as e:
+            logger.error(f"Ошибка при обработке JSON-LD: {e}")
+
+    return {
+        'title': title,
+        'category': category,
+        'source': source
+    }
+
+
+class DomainLimiter:
+    def __init__(self, concurrency: int, per_domain: int):
+        self.per_domain = per_domain
+        self._global = asyncio.Semaphore(concurrency)
+        self._domains: dict[str, tuple[asyncio.Semaphore, int]] = {}
+
+    @asynccontextmanager
+    async def __call__(self, url: str):
+        extracted = tldextract.extract(url)
+        domain = extracted.registered_domain or extracted.domain or url
+        semaphore, users = self._domains.get(domain, (None, 0))
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.per_domain)
+        self._domains[domain] = (semaphore, users + 1)
+        try:
+            async with semaphore, self._global:
+                yield
+        finally:
+            semaphore, users = self._domains[domain]
+            if users > 1:
+                self._domains[domain] = (semaphore, users - 1)
+            else:
+                del self._domains[domain]
+
+
+class MetadataFetcher:
+    def __init__(self, connect_timeout: float, read_timeout: float, total_timeout: float, max_bytes: int,
+                 max_connections: int, max_connections_per_host: int, concurrency: int, per_domain_concurrency: int):
+        self.limiter = DomainLimiter(concurrency, per_domain_concurrency)
+        self.timeout = aiohttp.ClientTimeout(total=total_timeout, sock_connect=connect_timeout, sock_read=read_timeout)
+        self.max_bytes = max_bytes
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        self._session: aiohttp.ClientSession | None = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                limit_per_host=self.max_connections_per_host,
+                ttl_dns_cache=300,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=self.timeout,
+                headers={'User-Agent': 'Mozilla/5.0 (compatible; linksinbot/1.0)', 'Accept': 'text/html,application/xhtml+xml'},
+            )
+        return self._session
+
+    async def fetch(self, url: str) -> dict:
+        started = time.perf_counter()
+        result = 'error'
+        try:
+            target = url if url.startswith(('http://', 'https://')) else 'https://' + url
+            async with self.limiter(target), self.session.get(target) as response:
+                if response.content_type not in ('text/html', 'application/xhtml+xml'):
+                    result = 'skipped'
+                    return {}
+                decoder = codecs.getincrementaldecoder(self._charset(response))(errors='replace')
+                parser = _HeadParser()
+                received = 0
+                async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                    received += len(chunk)
+                    parser.feed(decoder.decode(chunk))
+                    if parser.done or received >= self.max_bytes:
+                        break
+            result = 'ok'
+            return _build_metadata(parser, url)
+        except Exception as e:
+            logger.error(f"Ошибка при получении мета-данных: {e}")
+            return {}
+        finally:
+            metadata_duration.observe(time.perf_counter() - started, result)
+
+    @staticmethod
+    def _charset(response: aiohttp.ClientResponse) -> str:
+        try:
+            return codecs.lookup(response.charset or 'utf-8').name
+        except LookupError:
+            return 'utf-8'
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+
+
+class MetadataCache:
+    def __init__(self, max_size: int, ttl: float, negative_ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._inflight: dict[str, asyncio.Future] = {}
+
+    async def get(self, url: str, loader: Callable[[str], Awaitable[dict]]) -> dict:
+        key = canonicalize_url(url)
+        while True:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    return entry[1]
+                del self._entries[key]
+
+            future = self._inflight.get(key)
+            if future is None:
+                break
+            value = await asyncio.shield(future)
+            if value is not None:
+                return value
+            # the load failed or its task was cancelled, which says nothing about this caller, so load again
+
+        future = self._inflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            value = await loader(url)
+        except BaseException:
+            future.set_result(None)
+            raise
+        else:
+            self.put(key, value)
+            future.set_result(value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def put(self, url: str, value: dict) -> None:
+        key = canonicalize_url(url)
+        ttl = self.ttl if value else self.negative_ttl
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+metadata_fetcher = MetadataFetcher(
+    connect_timeout=config.METADATA_CONNECT_TIMEOUT,
+    read_timeout=config.METADATA_READ_TIMEOUT,
+    total_timeout=config.METADATA_TOTAL_TIMEOUT,
+    max_bytes=config.METADATA_MAX_BYTES,
+    max_connections=config.METADATA_MAX_CONNECTIONS,
+    max_connections_per_host=config.METADATA_MAX_CONNECTIONS_PER_HOST,
+    concurrency=config.METADATA_CONCURRENCY,
+    per_domain_concurrency=config.METADATA_PER_DOMAIN_CONCURRENCY,
+)
+
+metadata_cache = MetadataCache(
+    max_size=config.METADATA_CACHE_SIZE,
+    ttl=config.METADATA_CACHE_TTL,
+    negative_ttl=config.METADATA_CACHE_NEGATIVE_TTL,
+)
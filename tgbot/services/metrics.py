@@ -0,0 +1,208 @@
+import contextvars
+import logging
+import time
+
+import httpx
+from aiohttp import web
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from tgbot.data import config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float('inf'))
+
+# name of the handler serving the current update, used to attribute logged errors
+current_handler = contextvars.ContextVar('current_handler', default=None)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names: tuple[str, ...], values: tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        for labels, value in sorted(self._values.items()):
+            lines.append(f'{self.name}{_labels(self.labelnames, labels)} {_number(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels) -> None:
+        counts = self._values.get(labels)
+        if counts is None:
+            counts = self._values[labels] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[0][i] += 1
+                break
+        counts[1] += value
+        counts[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for labels, (buckets, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, buckets):
+                cumulative += bucket
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, labels, f'le="{_number(bound)}"')} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, labels)} {count}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return '\n'.join(line for metric in self._metrics for line in metric.render()) + '\n'
+
+
+registry = Registry()
+
+handler_duration = registry.register(Histogram('bot_handler_duration_seconds', 'Time spent in update handlers.', ('handler',)))
+handler_errors = registry.register(Counter('bot_handler_errors_total', 'Errors raised or logged while handling updates.', ('handler',)))
+metadata_duration = registry.register(Histogram('bot_metadata_fetch_duration_seconds', 'Link metadata fetches.', ('result',)))
+notion_duration = registry.register(Histogram('bot_notion_request_duration_seconds', 'Requests to the Notion API.', ('method', 'status')))
+db_duration = registry.register(Histogram('bot_db_query_duration_seconds', 'Database statements.', ('statement',)))
+db_errors = registry.register(Counter('bot_db_errors_total', 'Failed database statements.', ('statement',)))
+
+
+class ErrorCountingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__(level=logging.ERROR)
+
+    def emit(self, record: logging.LogRecord) -> None:
+        # aiogram logs exceptions that escape a handler, MetricsMiddleware has already counted those
+        if record.name.startswith('aiogram'):
+            return
+        handler_errors.inc(current_handler.get() or 'background')
+
+
+class TimedTransport(httpx.AsyncBaseTransport):
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.perf_counter()
+        status = 'error'
+        try:
+            response = await self.transport.handle_async_request(request)
+            status = str(response.status_code)
+            return response
+        finally:
+            notion_duration.observe(time.perf_counter() - started, request.method, status)
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+def _statement(statement: str) -> str:
+    return statement.lstrip().split(None, 1)[0].lower() if statement.strip() else 'unknown'
+
+
+def _query_started(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _query_finished(conn, cursor, statement, parameters, context, executemany):
+    conn.info['query_duration'] = time.perf_counter() - conn.info['query_started'].pop()
+
+
+def _query_failed(context):
+    started = context.connection.info.get('query_started') if context.connection is not None else None
+    if started:
+        started.pop()
+
+
+def time_queries(engine: AsyncEngine) -> None:
+    # one timer per engine; every consumer reads conn.info['query_duration'] in its own after_cursor_execute listener
+    sync_engine = engine.sync_engine
+    if event.contains(sync_engine, 'before_cursor_execute', _query_started):
+        return
+    event.listen(sync_engine, 'before_cursor_execute', _query_started)
+    event.listen(sync_engine, 'after_cursor_execute', _query_finished, insert=True)
+    event.listen(sync_engine, 'handle_error', _query_failed)
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    sync_engine = engine.sync_engine
+    time_queries(engine)
+
+    @event.listens_for(sync_engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        db_duration.observe(conn.info['query_duration'], _statement(statement))
+
+    @event.listens_for(sync_engine, 'handle_error')
+    def handle_error(context):
+        db_errors.inc(_statement(context.statement or ''))
+
+
+class MetricsServer:
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self._runner: web.AppRunner | None = None
+
+    async def start(self) -> None:
+        if not self.port or self._runner is not None:
+            return
+        app = web.Application()
+        app.router.add_get('/metrics', self._metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f'Metrics on http://{self.host}:{self.port}/metrics')
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    @staticmethod
+    async def _metrics(request: web.Request) -> web.Response:
+        return web.Response(body=registry.render().encode(), headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+
+def setup_metrics(engine: AsyncEngine) -> None:
+    instrument_engine(engine)
+    logging.getLogger().addHandler(ErrorCountingHandler())
+
+
+metrics_server = MetricsServer(config.METRICS_HOST, config.METRICS_PORT)
@@ -0,0 +1,116 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+import httpx
+from notion_client import AsyncClient
+
+from tgbot.data import config
+from tgbot.services.metrics import TimedTransport
+
+
+class RateLimiter:
+    def __init__(self, rate: float):
+        self.interval = 1 / rate
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def pause(self, seconds: float) -> None:
+        self._next = max(self._next, time.monotonic() + seconds)
+
+
+# notion_client writes the Authorization header onto its httpx client, so each
+# token gets its own client; the keep-alive connections live in one shared transport.
+class NotionClientPool:
+    def __init__(self, max_clients: int, ttl: float, max_connections: int, max_keepalive: int, timeout: float, rate: float,
+                 notion_version: str, base_url: str):
+        self.max_clients = max_clients
+        self.notion_version = notion_version
+        self.base_url = base_url
+        self.ttl = ttl
+        self.timeout = timeout
+        self.rate = rate
+        self._transport = TimedTransport(httpx.AsyncHTTPTransport(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive),
+        ))
+        self._clients: OrderedDict[str, tuple[AsyncClient, float]] = OrderedDict()
+        self._limiters: dict[str, RateLimiter] = {}
+
+    def get(self, token: str) -> AsyncClient:
+        now = time.monotonic()
+        cached = self._clients.get(token)
+        if cached is not None and now - cached[1] < self.ttl:
+            self._clients.move_to_end(token)
+            return cached[0]
+
+        http_client = httpx.AsyncClient(transport=self._transport)
+        client = AsyncClient(auth=token, client=http_client, timeout_ms=int(self.timeout * 1000), notion_version=self.notion_version,
+                             base_url=self.base_url)
+        self._clients[token] = (client, now)
+        self._clients.move_to_end(token)
+        while len(self._clients) > self.max_clients:
+            evicted, _ = self._clients.popitem(last=False)
+            self._limiters.pop(evicted, None)
+        return client
+
+    def limiter(self, token: str) -> RateLimiter:
+        limiter = self._limiters.get(token)
+        if limiter is None:
+            limiter = self._limiters[token] = RateLimiter(self.rate)
+        return limiter
+
+    def discard(self, token: str) -> None:
+        self._clients.pop(token, None)
+        self._limiters.pop(token, None)
+
+    async def close(self) -> None:
+        self._clients.clear()
+        self._limiters.clear()
+        await self._transport.aclose()
+
+
+def link_page_properties(link, category, source, title, priority) -> dict:
+    return {
+        "title": {"title": [{"text": {"content": title if title else ""}}]},
+        "link": {"url": link if link else ""},
+        "category": {"rich_text": [{"text": {"content": category if category else ""}}]},
+        "source": {"rich_text": [{"text": {"content": source if source else ""}}]},
+        "priority": {"number": priority if priority is not None else 0}
+    }
+
+
+def _plain_text(items) -> str:
+    return ''.join(item.get('plain_text') or item.get('text', {}).get('content', '') for item in items or [])
+
+
+def link_page_fields(page: dict) -> dict:
+    properties = page.get('properties', {})
+    return {
+        'page_id': page['id'],
+        'last_edited_time': page.get('last_edited_time'),
+        'title': _plain_text(properties.get('title', {}).get('title')),
+        'link': properties.get('link', {}).get('url'),
+        'category': _plain_text(properties.get('category', {}).get('rich_text')) or 'other',
+        'source': _plain_text(properties.get('source', {}).get('rich_text')) or None,
+        'priority': properties.get('priority', {}).get('number'),
+    }
+
+
+notion_pool = NotionClientPool(
+    max_clients=config.NOTION_CLIENT_CACHE_SIZE,
+    ttl=config.NOTION_CLIENT_TTL,
+    max_connections=config.NOTION_MAX_CONNECTIONS,
+    max_keepalive=config.NOTION_MAX_KEEPALIVE,
+    timeout=config.NOTION_TIMEOUT,
+    rate=config.NOTION_RATE_LIMIT,
+    notion_version=config.NOTION_VERSION,
+    base_url=config.NOTION_BASE_URL,
+)
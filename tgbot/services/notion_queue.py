@@ -0,0 +1,236 @@
+import asyncio
+import datetime
+import logging
+import random
+
+import httpx
+from notion_client.errors import APIErrorCode, APIResponseError, HTTPResponseError, RequestTimeoutError
+from sqlalchemy import delete, insert, update
+from sqlalchemy.future import select
+from sqlalchemy.orm import sessionmaker
+
+from tgbot.data import config
+from tgbot.database.database import AsyncSessionLocal, NotionOutbox, UserLink, Link, User
+from tgbot.services.notion import notion_pool, link_page_properties
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_CODES = {
+    APIErrorCode.RateLimited,
+    APIErrorCode.InternalServerError,
+    APIErrorCode.ServiceUnavailable,
+    APIErrorCode.ConflictError,
+}
+
+
+class RetryableError(Exception):
+    def __init__(self, message: str, retry_after: float | None = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _classify(error: Exception) -> Exception:
+    if isinstance(error, (httpx.TransportError, RequestTimeoutError)):
+        return RetryableError(str(error))
+    if isinstance(error, APIResponseError) and error.code in RETRYABLE_CODES:
+        retry_after = error.headers.get('retry-after') if error.code == APIErrorCode.RateLimited else None
+        return RetryableError(str(error), float(retry_after) if retry_after else None)
+    if isinstance(error, HTTPResponseError) and error.status >= 500:
+        return RetryableError(str(error))
+    return error
+
+
+class NotionOutboxWorker:
+    def __init__(self, session_pool: sessionmaker, workers: int, batch_size: int, poll_interval: float,
+                 max_attempts: int, lease: float):
+        self.session_pool = session_pool
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.lease = lease
+        self._wakeup = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def wake(self) -> None:
+        self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                processed = await self.process_batch()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f'error5820731: {e}')
+                processed = 0
+
+            if processed:
+                continue
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def process_batch(self) -> int:
+        async with self.session_pool() as session:
+            jobs = await self._claim(session)
+            if not jobs:
+                return 0
+
+            rows = await session.execute(
+                select(UserLink, Link, User)
+                .join(Link, Link.linkid == UserLink.linkid)
+                .join(User, User.userid == UserLink.userid)
+                .where(UserLink.userlinkid.in_([job.userlinkid for job in jobs if job.action == 'create']))
+            )
+            targets = {user_link.userlinkid: (user_link, link, user) for user_link, link, user in rows.all()}
+
+            archive_users = {job.userid for job in jobs if job.action == 'archive'}
+            users = {}
+            if archive_users:
+                rows = await session.execute(select(User).where(User.userid.in_(archive_users)))
+                users = {user.userid: user for user in rows.scalars().all()}
+
+            results = await asyncio.gather(
+                *(
+                    self._archive(users.get(job.userid), job.notion_page_id) if job.action == 'archive'
+                    else self._send(targets.get(job.userlinkid))
+                    for job in jobs
+                ),
+                return_exceptions=True,
+            )
+
+            done = []
+            orphans = []
+            for job, result in zip(jobs, results):
+                if not isinstance(result, Exception):
+                    if job.action == 'create' and not await self._finish_create(session, job, result):
+                        orphans.append({'userlinkid': None, 'userid': job.userid, 'action': 'archive', 'notion_page_id': result})
+                    done.append(job.jobid)
+                    continue
+
+                error = _classify(result)
+                attempts = job.attempts + 1
+                values = {'attempts': attempts, 'last_error': str(error)[:1000]}
+                if isinstance(error, RetryableError) and attempts < self.max_attempts:
+                    values['available_at'] = self._utcnow() + datetime.timedelta(seconds=self._backoff(attempts, error.retry_after))
+                else:
+                    values['attempts'] = max(attempts, self.max_attempts)
+                    if job.action == 'create':
+                        await session.execute(update(UserLink).where(UserLink.userlinkid == job.userlinkid).values(notion_status='failed'))
+                    logger.error(f'error2567891911: {job.action} userlink {job.userlinkid}: {error}')
+                await session.execute(update(NotionOutbox).where(NotionOutbox.jobid == job.jobid).values(**values))
+
+            if done:
+                await session.execute(delete(NotionOutbox).where(NotionOutbox.jobid.in_(done)))
+            if orphans:
+                await session.execute(insert(NotionOutbox), orphans)
+            await session.commit()
+            if orphans:
+                self.wake()
+            return len(jobs)
+
+    async def _finish_create(self, session, job: NotionOutbox, page_id: str | None) -> bool:
+        # Core update, the row may have been deleted by /deletelinks while the page was being created;
+        # returns False when a created page has no link left to attach to
+        values = {'notion_page_id': page_id, 'notion_status': 'synced'} if page_id else {'notion_status': None}
+        result = await session.execute(update(UserLink).where(UserLink.userlinkid == job.userlinkid).values(**values))
+        return not page_id or result.rowcount > 0
+
+    async def _claim(self, session) -> list[NotionOutbox]:
+        now = self._utcnow()
+        jobids = (await session.execute(
+            select(NotionOutbox.jobid)
+            .where(NotionOutbox.available_at <= now, NotionOutbox.attempts < self.max_attempts)
+            .order_by(NotionOutbox.available_at)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        )).scalars().all()
+        if not jobids:
+            await session.rollback()
+            return []
+
+        # SQLite ignores FOR UPDATE, so the conditional update is what claims a job:
+        # a job another worker leased in the meantime no longer matches available_at <= now
+        result = await session.execute(
+            update(NotionOutbox)
+            .where(NotionOutbox.jobid.in_(jobids), NotionOutbox.available_at <= now)
+            .values(available_at=now + datetime.timedelta(seconds=self.lease))
+            .returning(NotionOutbox)
+        )
+        jobs = list(result.scalars().all())
+        await session.commit()
+        return jobs
+
+    async def _send(self, target) -> str | None:
+        if target is None:
+            return None
+        user_link, link, user = target
+        if user_link.notion_page_id:
+            return user_link.notion_page_id
+        if not user.token or not user.notion_db_id:
+            return None
+
+        limiter = notion_pool.limiter(user.token)
+        await limiter.wait()
+        try:
+            page = await notion_pool.get(user.token).pages.create(
+                parent={"database_id": user.notion_db_id},
+                properties=link_page_properties(link.link, user_link.category, link.source, link.title, user_link.priority),
+            )
+        except Exception as e:
+            error = _classify(e)
+            if isinstance(error, RetryableError) and error.retry_after:
+                limiter.pause(error.retry_after)
+            raise
+        return page['id']
+
+    async def _archive(self, user, page_id: str) -> None:
+        if user is None or not user.token or not page_id:
+            return None
+
+        limiter = notion_pool.limiter(user.token)
+        await limiter.wait()
+        try:
+            await notion_pool.get(user.token).pages.update(page_id=page_id, archived=True)
+        except APIResponseError as e:
+            # the page was already removed in Notion
+            if e.code == APIErrorCode.ObjectNotFound:
+                return None
+            error = _classify(e)
+            if isinstance(error, RetryableError) and error.retry_after:
+                limiter.pause(error.retry_after)
+            raise
+        return None
+
+    @staticmethod
+    def _backoff(attempts: int, retry_after: float | None) -> float:
+        delay = min(2 ** attempts, 600) * random.uniform(0.5, 1.5)
+        return max(delay, retry_after or 0)
+
+    @staticmethod
+    def _utcnow() -> datetime.datetime:
+        return datetime.datetime.now(datetime.timezone.utc)
+
+
+notion_outbox = NotionOutboxWorker(
+    AsyncSessionLocal,
+    workers=config.NOTION_QUEUE_WORKERS,
+    batch_size=config.NOTION_QUEUE_BATCH_SIZE,
+    poll_interval=config.NOTION_QUEUE_POLL_INTERVAL,
+    max_attempts=config.NOTION_QUEUE_MAX_ATTEMPTS,
+    lease=config.NOTION_QUEUE_LEASE,
+)
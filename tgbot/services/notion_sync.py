@@ -0,0 +1,184 @@
+import datetime
+import logging
+from dataclasses import dataclass
+
+from sqlalchemy import delete, insert, update, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from tgbot.data import config
+from tgbot.database.database import User, UserLink, NotionOutbox, dialect_insert, upsert_links
+from tgbot.services.cache import category_cache
+from tgbot.services.notion import notion_pool, link_page_fields
+from tgbot.services.notion_queue import notion_outbox
+from tgbot.services.urls import url_hash
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SyncResult:
+    pulled: int = 0
+    updated: int = 0
+    created: int = 0
+    pushed: int = 0
+
+
+class NotionSync:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def run(self, userid: int) -> SyncResult | None:
+        user = (await self.session.execute(select(User).where(User.userid == userid))).scalar_one_or_none()
+        if user is None or not user.token or not user.notion_db_id:
+            return None
+
+        result = SyncResult()
+        pages, cursor = await self._pull(user)
+        result.pulled = len(pages)
+        if pages:
+            result.updated, result.created = await self._apply(user.userid, pages)
+        result.pushed = await self._push(user.userid)
+
+        user.notion_cursor = cursor
+        await self.session.commit()
+
+        if result.updated or result.created:
+            category_cache.invalidate(user.userid)
+        if result.pushed:
+            notion_outbox.wake()
+        return result
+
+    async def _pull(self, user: User) -> tuple[list[dict], datetime.datetime | None]:
+        notion = notion_pool.get(user.token)
+        limiter = notion_pool.limiter(user.token)
+        body = {
+            'page_size': config.NOTION_SYNC_PAGE_SIZE,
+            'sorts': [{'timestamp': 'last_edited_time', 'direction': 'ascending'}],
+        }
+        cursor = user.notion_cursor
+        if cursor is not None and cursor.tzinfo is None:
+            cursor = cursor.replace(tzinfo=datetime.timezone.utc)
+        if cursor:
+            # last_edited_time has minute precision, so the boundary minute is read again
+            body['filter'] = {
+                'timestamp': 'last_edited_time',
+                'last_edited_time': {'on_or_after': cursor.isoformat()},
+            }
+
+        pages = []
+        while True:
+            await limiter.wait()
+            response = await notion.request(path=f'databases/{user.notion_db_id}/query', method='POST', body=body)
+            for page in response.get('results', []):
+                fields = link_page_fields(page)
+                if fields['link']:
+                    pages.append(fields)
+                edited = datetime.datetime.fromisoformat(page['last_edited_time'].replace('Z', '+00:00'))
+                if cursor is None or edited > cursor:
+                    cursor = edited
+            if not response.get('has_more'):
+                return pages, cursor
+            body['start_cursor'] = response['next_cursor']
+
+    async def _apply(self, userid: int, pages: list[dict]) -> tuple[int, int]:
+        by_page = {page['page_id']: page for page in pages}
+        rows = await self.session.execute(
+            select(UserLink.userlinkid, UserLink.notion_page_id, UserLink.category, UserLink.priority)
+            .where(UserLink.userid == userid, UserLink.notion_page_id.in_(by_page))
+        )
+        known = set()
+        changes = []
+        for row in rows:
+            known.add(row.notion_page_id)
+            page = by_page[row.notion_page_id]
+            if (page['category'], page['priority']) != (row.category, row.priority):
+                changes.append({'userlinkid': row.userlinkid, 'category': page['category'], 'priority': page['priority']})
+        if changes:
+            await self.session.execute(update(UserLink), changes)
+
+        created = [page for page_id, page in by_page.items() if page_id not in known]
+        attached = inserted = 0
+        if created:
+            attached, inserted = await self._insert_pages(userid, created)
+        return len(changes) + attached, inserted
+
+    async def _insert_pages(self, userid: int, pages: list[dict]) -> tuple[int, int]:
+        hashes = {}
+        for page in pages:
+            try:
+                hashes[url_hash(page['link'])] = page
+            except ValueError:
+                logger.error(f"error7285663: bad link in Notion page {page['page_id']}: {page['link']}")
+        linkids = await upsert_links(self.session, [{
+            'link': page['link'],
+            'url_hash': link_hash,
+            'title': page['title'] or 'Без названия',
+            'source': page['source'],
+        } for link_hash, page in hashes.items()])
+        by_link = {linkid: hashes[link_hash] for link_hash, linkid in linkids.items()}
+        if not by_link:
+            return 0, 0
+
+        # the page may already exist for a local link that never learned its page id (pushed before the
+        # outbox existed, or the outbox commit was lost), so it is attached instead of pushed again
+        rows = await self.session.execute(
+            select(UserLink.userlinkid, UserLink.linkid, UserLink.notion_page_id)
+            .where(UserLink.userid == userid, UserLink.linkid.in_(by_link))
+        )
+        attached = []
+        for row in rows:
+            page = by_link.pop(row.linkid)
+            if row.notion_page_id is None:
+                attached.append({
+                    'userlinkid': row.userlinkid,
+                    'notion_page_id': page['page_id'],
+                    'notion_status': 'synced',
+                    'category': page['category'],
+                    'priority': page['priority'],
+                })
+        if attached:
+            await self.session.execute(update(UserLink), attached)
+            await self.session.execute(delete(NotionOutbox).where(
+                NotionOutbox.userlinkid.in_([row['userlinkid'] for row in attached]),
+                NotionOutbox.action == 'create',
+            ))
+
+        if not by_link:
+            return len(attached), 0
+        result = await self.session.execute(
+            dialect_insert(self.session, UserLink)
+            .on_conflict_do_nothing(index_elements=[UserLink.userid, UserLink.linkid])
+            .returning(UserLink.userlinkid),
+            [{
+                'userid': userid,
+                'linkid': linkid,
+                'category': page['category'],
+                'priority': page['priority'],
+                'notion_page_id': page['page_id'],
+                'notion_status': 'synced',
+            } for linkid, page in by_link.items()],
+        )
+        return len(attached), len(result.all())
+
+    async def _push(self, userid: int) -> int:
+        rows = await self.session.execute(
+            select(UserLink.userlinkid).where(
+                UserLink.userid == userid,
+                UserLink.notion_page_id.is_(None),
+                or_(UserLink.notion_status.is_(None), UserLink.notion_status == 'failed'),
+            )
+        )
+        userlinkids = rows.scalars().all()
+        if not userlinkids:
+            return 0
+
+        await self.session.execute(delete(NotionOutbox).where(NotionOutbox.userlinkid.in_(userlinkids)))
+        await self.session.execute(
+            insert(NotionOutbox),
+            [{'userlinkid': userlinkid, 'userid': userid} for userlinkid in userlinkids],
+        )
+        await self.session.execute(
+            update(UserLink).where(UserLink.userlinkid.in_(userlinkids)).values(notion_status='pending')
+        )
+        return len(userlinkids)
@@ -0,0 +1,96 @@
+import contextvars
+import logging
+import random
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from tgbot.data import config
+from tgbot.services.metrics import current_handler, time_queries
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER = r'(?:\?|%s|\$\d+|:\w+|%\(\w+\)s)'
+# expanded IN lists and multi-row VALUES differ only in the number of placeholders
+PLACEHOLDER_LIST_RE = re.compile(rf'\(\s*{PLACEHOLDER}(?:\s*,\s*{PLACEHOLDER})*\s*\)(?:\s*,\s*\(\s*{PLACEHOLDER}(?:\s*,\s*{PLACEHOLDER})*\s*\))*')
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+def query_shape(statement: str) -> str:
+    return PLACEHOLDER_LIST_RE.sub('(...)', WHITESPACE_RE.sub(' ', statement).strip())
+
+
+@dataclass
+class UpdateQueries:
+    statements: int = 0
+    duration: float = 0.0
+    handler: str | None = None
+    raw: Counter = field(default_factory=Counter)
+
+    def shapes(self) -> Counter:
+        shapes = Counter()
+        for statement, count in self.raw.items():
+            shapes[query_shape(statement)] += count
+        return shapes
+
+
+current_queries = contextvars.ContextVar('current_queries', default=None)
+
+
+class QueryLog:
+    def __init__(self, slow_threshold: float, sample_rate: float, repeat_threshold: int, report: bool):
+        self.slow_threshold = slow_threshold
+        self.sample_rate = sample_rate
+        self.repeat_threshold = repeat_threshold
+        self.report = report
+
+    def instrument(self, engine: AsyncEngine) -> None:
+        time_queries(engine)
+        event.listen(engine.sync_engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        duration = conn.info['query_duration']
+
+        stats = current_queries.get()
+        handler = current_handler.get() or ('update' if stats is not None else 'background')
+        if stats is not None:
+            stats.statements += 1
+            stats.duration += duration
+            stats.raw[statement] += 1
+            if stats.handler is None:
+                stats.handler = current_handler.get()
+
+        # parameters are never logged, they can hold Notion tokens
+        if duration >= self.slow_threshold and random.random() < self.sample_rate:
+            logger.warning(f'slow query {duration * 1000:.1f} ms in {handler}: {query_shape(statement)[:1000]}')
+
+    def begin(self) -> tuple[UpdateQueries, contextvars.Token]:
+        stats = UpdateQueries()
+        return stats, current_queries.set(stats)
+
+    def finish(self, stats: UpdateQueries, token: contextvars.Token, update_id: int, userid: int | None) -> None:
+        current_queries.reset(token)
+        if not stats.statements:
+            return
+
+        shapes = stats.shapes()
+        handler = stats.handler or 'no handler'
+        for shape, count in shapes.items():
+            if count >= self.repeat_threshold:
+                logger.warning(f'update {update_id} ({handler}, user {userid}) ran the same query {count} times, possible N+1: {shape[:500]}')
+
+        if self.report:
+            top = '; '.join(f'{count}x {shape[:120]}' for shape, count in shapes.most_common(3))
+            logger.info(f'update {update_id} ({handler}, user {userid}): {stats.statements} statements, '
+                        f'{len(shapes)} distinct, {stats.duration * 1000:.1f} ms in DB; {top}')
+
+
+query_log = QueryLog(
+    slow_threshold=config.DB_SLOW_QUERY_MS / 1000,
+    sample_rate=config.DB_SLOW_QUERY_SAMPLE,
+    repeat_threshold=config.DB_REPEATED_QUERY_THRESHOLD,
+    report=config.DB_QUERY_REPORT,
+)
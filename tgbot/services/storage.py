@@ -0,0 +1,182 @@
+import asyncio
+import copy
+import datetime
+import logging
+import time
+from typing import Any, Dict, Optional
+
+import orjson
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage, MemoryStorageRecord
+from sqlalchemy import delete, func
+from sqlalchemy.future import select
+from sqlalchemy.orm import sessionmaker
+
+from tgbot.database.database import FSMRecord, dialect_insert
+from tgbot.services.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+
+class ExpiringMemoryStorage(MemoryStorage):
+    def __init__(self, ttl: float, sweep_interval: float):
+        super().__init__()
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._touched: dict[StorageKey, float] = {}
+        self._last_sweep = time.monotonic()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        self._touch(key)
+        await super().set_state(key, state)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        record = self._record(key)
+        return record.state if record else None
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        self._touch(key)
+        await super().set_data(key, data)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        record = self._record(key)
+        return record.data.copy() if record else {}
+
+    async def get_value(self, storage_key: StorageKey, dict_key: str, default: Optional[Any] = None) -> Optional[Any]:
+        record = self._record(storage_key)
+        return copy.copy(record.data.get(dict_key, default)) if record else default
+
+    def _record(self, key: StorageKey) -> MemoryStorageRecord | None:
+        # the sweep only runs on writes, so an abandoned session is dropped here when it is read
+        touched = self._touched.get(key)
+        if touched is not None and time.monotonic() - touched > self.ttl:
+            self.storage.pop(key, None)
+            del self._touched[key]
+            return None
+        return self.storage.get(key)
+
+    def _touch(self, key: StorageKey) -> None:
+        now = time.monotonic()
+        self._touched[key] = now
+        if now - self._last_sweep >= self.sweep_interval:
+            self.sweep(now)
+
+    def sweep(self, now: float) -> None:
+        self._last_sweep = now
+        for key, touched in list(self._touched.items()):
+            record: MemoryStorageRecord | None = self.storage.get(key)
+            if now - touched > self.ttl or (record and record.state is None and not record.data):
+                self.storage.pop(key, None)
+                del self._touched[key]
+
+
+class DatabaseStorage(BaseStorage):
+    def __init__(self, session_pool: sessionmaker, key_builder: KeyBuilder | None = None,
+                 flush_interval: float = 0.1, cache_ttl: float = 10, cache_size: int = 10000,
+                 ttl: float = 24 * 3600, sweep_interval: float = 600):
+        self.session_pool = session_pool
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._last_sweep = time.monotonic()
+        self._sweep_task: asyncio.Task | None = None
+        self.key_builder = key_builder or DefaultKeyBuilder()
+        self.flush_interval = flush_interval
+        self.cache_ttl = cache_ttl
+        self._cache = LRUCache(cache_size, cache_ttl)
+        self._pending: dict[str, tuple[Optional[str], dict]] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: asyncio.Task | None = None
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        storage_key = self.key_builder.build(key)
+        _, data = await self._load(storage_key)
+        self._store(storage_key, (state.state if isinstance(state, State) else state, data))
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _ = await self._load(self.key_builder.build(key))
+        return state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        storage_key = self.key_builder.build(key)
+        state, _ = await self._load(storage_key)
+        self._store(storage_key, (state, copy.deepcopy(data)))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, data = await self._load(self.key_builder.build(key))
+        return copy.deepcopy(data)
+
+    async def close(self) -> None:
+        for task in (self._flush_task, self._sweep_task):
+            if task is not None:
+                task.cancel()
+        await self.flush()
+
+    async def sweep(self) -> None:
+        cutoff = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=self.ttl)
+        try:
+            async with self.session_pool() as session:
+                await session.execute(delete(FSMRecord).where(FSMRecord.updated_at < cutoff))
+                await session.commit()
+        except Exception as e:
+            logger.error(f'error7710244: {e}')
+
+    async def _load(self, storage_key: str) -> tuple[Optional[str], dict]:
+        record = self._pending.get(storage_key) or self._cache.get(storage_key)
+        if record is not None:
+            return record
+
+        # expired rows are only deleted by the periodic sweep, so they are filtered here; the cutoff leaves room for
+        # the cache lifetime so a cached row cannot be served past the TTL
+        cutoff = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=max(self.ttl - self.cache_ttl, 0))
+        async with self.session_pool() as session:
+            row = (await session.execute(
+                select(FSMRecord.state, FSMRecord.data).where(FSMRecord.key == storage_key, FSMRecord.updated_at >= cutoff)
+            )).first()
+        record = (row.state, orjson.loads(row.data) if row.data else {}) if row else (None, {})
+        self._cache.put(storage_key, record)
+        return record
+
+    def _store(self, storage_key: str, record: tuple[Optional[str], dict]) -> None:
+        self._pending[storage_key] = record
+        self._cache.put(storage_key, record)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+        if time.monotonic() - self._last_sweep >= self.sweep_interval and (self._sweep_task is None or self._sweep_task.done()):
+            self._last_sweep = time.monotonic()
+            self._sweep_task = asyncio.create_task(self.sweep())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            pending, self._pending = self._pending, {}
+            if not pending:
+                return
+
+            removed = [key for key, (state, data) in pending.items() if state is None and not data]
+            rows = [
+                {'key': key, 'state': state, 'data': orjson.dumps(data).decode()}
+                for key, (state, data) in pending.items()
+                if state is not None or data
+            ]
+            try:
+                async with self.session_pool() as session:
+                    if removed:
+                        await session.execute(delete(FSMRecord).where(FSMRecord.key.in_(removed)))
+                    if rows:
+                        insert = dialect_insert(session, FSMRecord)
+                        await session.execute(
+                            insert.on_conflict_do_update(
+                                index_elements=[FSMRecord.key],
+                                set_={'state': insert.excluded.state, 'data': insert.excluded.data, 'updated_at': func.now()},
+                            ),
+                            rows,
+                        )
+                    await session.commit()
+            except Exception as e:
+                logger.error(f'error7710243: {e}')
+                for key, record in pending.items():
+                    self._pending.setdefault(key, record)
@@ -0,0 +1,142 @@
+import hashlib
+import re
+from functools import lru_cache
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+import tldextract
+
+SCHEME_RE = re.compile(r'^[a-zA-Z][a-zA-Z0-9+.-]*://')
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+TRACKING_PARAMS = {'fbclid', 'gclid', 'yclid', 'dclid', 'msclkid', 'igshid', 'mc_cid', 'mc_eid', '_ga', 'ref_src'}
+
+
+def normalize_url(url: str) -> str:
+    url = url.strip()
+    if not SCHEME_RE.match(url):
+        url = 'https://' + url
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').rstrip('.')
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f'{host}:{parts.port}'
+    return urlunsplit((scheme, host, parts.path or '/', parts.query, ''))
+
+
+def canonicalize_url(url: str) -> str:
+    parts = urlsplit(normalize_url(url))
+    scheme = 'https' if parts.scheme == 'http' else parts.scheme
+    host = parts.netloc.removeprefix('www.')
+    path = parts.path.rstrip('/') or '/'
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith('utm_') and key.lower() not in TRACKING_PARAMS
+    )
+    return urlunsplit((scheme, host, path, urlencode(query), ''))
+
+
+def url_hash(url: str) -> bytes:
+    return hashlib.sha256(canonicalize_url(url).encode()).digest()
+
+
+LINK_RE = re.compile(
+    r'(?<![\w@.\-/])'
+    r'(https?://)?'
+    r'((?:[\w-]+\.)+[^\W\d_]{2,63})'
+    r'(?::(\d{2,5}))?'
+    r'(?:[/?#][^\s<>"\'«»]*)?',
+    re.IGNORECASE,
+)
+# every LINK_RE match ends its host with a dot and a letter, searching for that is far cheaper than the full pattern
+LINK_SHAPE_RE = re.compile(r'\.[^\W\d_]')
+TRAILING_PUNCTUATION = '.,;:!?\'"'
+ASTRAL_RE = re.compile('[\U00010000-\U0010ffff]')
+# public suffixes that are far more often file extensions when written without a scheme or path
+FILE_SUFFIXES = {'py', 'sh', 'md', 'zip', 'mov', 'ps', 'so'}
+
+
+def _strip_trailing(link: str) -> str:
+    while link:
+        if link[-1] in TRAILING_PUNCTUATION:
+            link = link[:-1]
+        elif link[-1] == ')' and link.count('(') < link.count(')'):
+            link = link[:-1]
+        else:
+            break
+    return link
+
+
+@lru_cache(maxsize=1)
+def _top_level_domains() -> frozenset[str]:
+    return frozenset(suffix.rpartition('.')[2] for suffix in tldextract.tldextract.TLD_EXTRACTOR.tlds)
+
+
+@lru_cache(maxsize=4096)
+def _public_suffix(host: str) -> str | None:
+    extracted = tldextract.extract(host)
+    return extracted.suffix if extracted.suffix and extracted.domain else None
+
+
+def _is_valid_host(host: str, has_scheme: bool, has_path: bool) -> bool:
+    # file names like notes.txt end in a label that is no top-level domain, they never reach tldextract or its cache
+    label = host.rpartition('.')[2]
+    if label not in _top_level_domains() and not label.startswith('xn--'):
+        return False
+    suffix = _public_suffix(host)
+    if suffix is None:
+        return False
+    return has_scheme or has_path or host.startswith('www.') or suffix not in FILE_SUFFIXES
+
+
+def is_valid_link(link: str) -> bool:
+    has_scheme = SCHEME_RE.match(link) is not None
+    try:
+        parts = urlsplit(link if has_scheme else 'https://' + link)
+        host = parts.hostname
+        parts.port  # raises ValueError for a malformed port
+    except ValueError:
+        return False
+    if parts.scheme not in ('http', 'https') or not host:
+        return False
+    return _is_valid_host(host, has_scheme, bool(parts.query or parts.fragment) or parts.path not in ('', '/'))
+
+
+def _entity_links(text: str, entities) -> list[str]:
+    # offsets are in UTF-16 code units, they match str indexes unless the text has astral characters (emoji)
+    encoded = text.encode('utf-16-le') if ASTRAL_RE.search(text) else None
+    links = []
+    for entity in entities:
+        if entity.type == 'text_link':
+            # drop non-web targets such as tg:// and mailto:
+            if entity.url[:8].lower().startswith(('http://', 'https://')):
+                links.append(entity.url)
+        elif entity.type == 'url':
+            if encoded is None:
+                links.append(text[entity.offset:entity.offset + entity.length])
+            else:
+                links.append(encoded[entity.offset * 2:(entity.offset + entity.length) * 2].decode('utf-16-le'))
+    return links
+
+
+def extract_links(text: str | None, entities=None) -> list[str]:
+    if not text:
+        return []
+
+    # entities mean Telegram has already parsed the text, its url entities are taken as they are
+    # and nothing else is searched; only text without entities goes through the validated fallback
+    if entities:
+        links = _entity_links(text, entities)
+        return list(dict.fromkeys(links)) if len(links) > 1 else links
+    if not LINK_SHAPE_RE.search(text):
+        return []
+
+    # the pattern already guarantees the URL shape, so only the port and the host's public suffix are checked
+    links = []
+    for match in LINK_RE.finditer(text):
+        scheme, host, port = match.groups()
+        if port and int(port) > 65535:
+            continue
+        link = _strip_trailing(match.group())
+        rest = link[match.end(3 if port else 2) - match.start():]
+        if _is_valid_host(host.lower(), scheme is not None, rest not in ('', '/')):
+            links.append(link)
+    return list(dict.fromkeys(links))
@@ -0,0 +1,74 @@
+import asyncio
+import logging
+import re
+from typing import Any
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from tgbot.data import config
+
+logger = logging.getLogger(__name__)
+
+# what Telegram accepts as secret_token
+SECRET_RE = re.compile(r'[A-Za-z0-9_-]{1,256}')
+
+
+class LimitedRequestHandler(SimpleRequestHandler):
+    # The slot is taken before Telegram gets its 200, so a full bot pushes back on
+    # the webhook connection instead of piling up unbounded background tasks.
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, max_in_flight: int, **kwargs: Any) -> None:
+        super().__init__(dispatcher=dispatcher, bot=bot, handle_in_background=True, **kwargs)
+        self._slots = asyncio.Semaphore(max_in_flight)
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        update = await request.json(loads=bot.session.json_loads)
+        await self._slots.acquire()
+        task = asyncio.create_task(self._background_feed_update(bot=bot, update=update))
+        self._background_feed_update_tasks.add(task)
+        task.add_done_callback(self._background_feed_update_tasks.discard)
+        task.add_done_callback(lambda _: self._slots.release())
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    async def close(self) -> None:
+        if self._background_feed_update_tasks:
+            await asyncio.wait(self._background_feed_update_tasks, timeout=30)
+        await super().close()
+
+
+async def aiogram_on_startup_webhook(dispatcher: Dispatcher, bot: Bot) -> None:
+    if not config.WEBHOOK_URL:
+        logger.info('WEBHOOK_URL is not set, waiting for updates without registering the webhook')
+        return
+    await bot.set_webhook(
+        url=config.WEBHOOK_URL.rstrip('/') + config.WEBHOOK_PATH,
+        secret_token=config.WEBHOOK_SECRET,
+        allowed_updates=dispatcher.resolve_used_update_types(),
+        max_connections=config.WEBHOOK_MAX_CONNECTIONS,
+    )
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot) -> None:
+    # without a secret aiogram accepts any POST, i.e. forged updates for any user
+    if not config.WEBHOOK_SECRET or not SECRET_RE.fullmatch(config.WEBHOOK_SECRET):
+        raise ValueError('webhook mode needs WEBHOOK_SECRET of 1-256 characters A-Z, a-z, 0-9, _ or -')
+
+    app = web.Application()
+    LimitedRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        max_in_flight=config.WEBHOOK_MAX_IN_FLIGHT,
+        secret_token=config.WEBHOOK_SECRET,
+    ).register(app, path=config.WEBHOOK_PATH)
+    dp.startup.register(aiogram_on_startup_webhook)
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, config.WEBHOOK_HOST, config.WEBHOOK_PORT).start()
+    logger.info(f'Webhook server listening on {config.WEBHOOK_HOST}:{config.WEBHOOK_PORT}{config.WEBHOOK_PATH}')
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
@@ -9,3 +9,4 @@ class UserStages(StatesGroup):
     get_category = State()
     yes_no = State()
     select_priority =State()
+    delete_confirm = State()